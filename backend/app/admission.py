@@ -0,0 +1,209 @@
+# backend/app/admission.py
+"""Admission control: per-class concurrency budgets with a short wait queue.
+
+Requests are classified before they reach a threadpool thread or a pooled
+connection:
+
+    write   POST / PUT / DELETE（購入登録・一括登録・取込）
+    lookup  GET /products/...（スキャン照合・検索・カタログ配信）
+    read    その他の GET（取引参照・一覧・レポート）
+    export  GET /exports/...（月次エクスポート。数分続くストリーム）
+    health  /health, /ready, /metrics, /cache/stats
+
+Each class admits ``concurrency`` requests at a time and lets up to
+``queue`` more wait in FIFO order for at most ``wait`` seconds. A request is
+rejected at once with ``503`` and ``Retry-After`` when the queue is full or
+when the expected wait (queue position × recent service time) already
+exceeds ``wait``; a queued request that is not admitted in time is rejected
+too. When MySQL slows down, checkouts back off while scans and health
+checks keep their own slots.
+
+The budgets are per worker process and enforced on the event loop, so the
+default totals stay below the 40 threads of the AnyIO threadpool.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 長時間つながったままのストリーム（SSE）は対象外
+EXEMPT_PREFIXES = ("/events/",)
+HEALTH_PATHS = ("/health", "/ready", "/metrics", "/cache/stats")
+EXPORT_PREFIX = "/exports/"
+
+EWMA_ALPHA = 0.2
+
+
+def _limit(name: str, concurrency: int, queue: int, wait: float) -> Dict[str, float]:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return {
+        "concurrency": int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        "queue": int(os.getenv(prefix + "QUEUE", str(queue))),
+        "wait": float(os.getenv(prefix + "WAIT", str(wait))),
+    }
+
+
+# 既定値はワーカーあたりのプール（DB_POOL_SIZE + DB_MAX_OVERFLOW = 15）を目安にする
+LIMITS = {
+    "write": _limit("write", 8, 16, 2.0),
+    "lookup": _limit("lookup", 16, 64, 0.5),
+    "read": _limit("read", 4, 8, 2.0),
+    # 長時間のエクスポートが read の枠を埋めて伝票参照・一覧を 503 にしないよう別枠にする
+    "export": _limit("export", 2, 4, 5.0),
+    "health": _limit("health", 4, 16, 0.5),
+}
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Admission class of a request, or ``None`` when it is not limited."""
+    if path.startswith(EXEMPT_PREFIXES) or method == "OPTIONS":
+        return None
+    if path in HEALTH_PATHS or path.startswith("/health/"):
+        return "health"
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return "write"
+    if path.startswith("/products"):
+        return "lookup"
+    if path.startswith(EXPORT_PREFIX):
+        return "export"
+    return "read"
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """FIFO concurrency limiter for one class (event-loop only; no locking needed)."""
+
+    def __init__(self, name: str, concurrency: int, queue: int, wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = queue
+        self.max_wait = wait
+        self.in_flight = 0
+        self.service_time = 0.0  # 直近の処理時間の指数移動平均（秒）
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "deadline": 0, "timeout": 0}
+        self._waiters: deque = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self, position: int) -> float:
+        return math.ceil(position / self.concurrency) * self.service_time
+
+    def _reject(self, reason: str, position: int) -> Rejected:
+        self.rejected[reason] += 1
+        return Rejected(reason, max(1.0, self.expected_wait(position)))
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        position = self.queued + 1
+        if position > self.max_queue:
+            raise self._reject("queue_full", position)
+        # 待っても間に合わない見込みなら、並ばせずにすぐ断る
+        if self.expected_wait(position) > self.max_wait:
+            raise self._reject("deadline", position)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                waiter.cancel()
+                raise self._reject("timeout", self.queued + 1)
+            # タイムアウトと同時に枠を譲られた場合はそのまま通す
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)  # 譲られた枠を次へ回す
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+
+    def release(self, elapsed: float) -> None:
+        if elapsed:
+            self.service_time += EWMA_ALPHA * (elapsed - self.service_time)
+        # 枠は待ち行列の先頭へ直接渡す（in_flight は据え置き）
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "max_wait_seconds": self.max_wait,
+            "service_time_ms": round(self.service_time * 1000, 3),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+gates: Dict[str, AdmissionGate] = {name: AdmissionGate(name, **limit) for name, limit in LIMITS.items()}
+
+
+def stats() -> Dict[str, Dict[str, object]]:
+    return {name: gate.stats() for name, gate in gates.items()}
+
+
+class AdmissionMiddleware:
+    """Hold each request to its class budget; shed load with ``503`` + ``Retry-After``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        gate = gates[name]
+        try:
+            await gate.acquire()
+        except Rejected as exc:
+            retry_after = str(math.ceil(exc.retry_after))
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": f"server busy ({name}: {exc.reason}); retry later"},
+                headers={"Retry-After": retry_after},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - start)
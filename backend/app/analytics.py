@@ -0,0 +1,305 @@
+# backend/app/analytics.py
+"""Columnar in-memory store of recent sales lines for top-N, hourly and basket queries.
+
+Lines of the last ``ANALYTICS_WINDOW_HOURS`` are held as parallel NumPy
+arrays (34 bytes per line, no Python object per row) and queried with
+vectorized operations. New receipts are appended incrementally from a
+``trd_id`` high-water mark, the same way ``rollup.catch_up`` does; lines that
+fall out of the window are compacted away on refresh.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .models import Transaction, TransactionDetail
+from .rollup import BUSINESS_DAY_UTC_OFFSET_HOURS, settled_prefix
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+ANALYTICS_WINDOW_HOURS = float(os.getenv("ANALYTICS_WINDOW_HOURS", "24"))
+ANALYTICS_REFRESH = float(os.getenv("ANALYTICS_REFRESH", "5"))  # 秒（追記の間隔）
+# この秒数より新しい取引は次回に回す（後から commit される小さい trd_id を取りこぼさない）
+ANALYTICS_SETTLE = float(os.getenv("ANALYTICS_SETTLE", "2"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "5000"))  # 1 回に読む取引数
+
+_COLUMNS = {
+    "trd_id": np.int64,
+    "prd_id": np.int32,
+    "store": np.int16,  # store_cd の辞書番号
+    "quantity": np.int32,
+    "amount": np.int64,  # line_amount
+    "ts": np.int64,  # UTC エポック秒
+}
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch(dt: datetime) -> int:
+    return int((dt - _EPOCH).total_seconds())
+
+
+def _sorted_unique(values: np.ndarray) -> np.ndarray:
+    # np.unique の既定（ハッシュ）より、ソートして隣接比較する方が int64 では速い
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+
+class SalesColumns:
+    def __init__(self, window_hours: float = ANALYTICS_WINDOW_HOURS):
+        self.window = timedelta(hours=window_hours)
+        self.size = 0
+        self.last_trd_id: Optional[int] = None  # None = 未ロード
+        self.last_refresh = 0.0
+        self.loads = 0
+        self._cols: Dict[str, np.ndarray] = {name: np.empty(0, dtype) for name, dtype in _COLUMNS.items()}
+        self._stores: List[str] = []
+        self._store_codes: Dict[str, int] = {}
+        self.names: Dict[int, str] = {}  # prd_id -> 直近の販売時の商品名
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    # -- 追記・削除 -----------------------------------------------------------
+    def _store_code(self, store_cd: str) -> int:
+        code = self._store_codes.get(store_cd)
+        if code is None:
+            code = self._store_codes[store_cd] = len(self._stores)
+            self._stores.append(store_cd)
+        return code
+
+    def _append(self, rows) -> None:
+        n = len(rows)
+        if not n:
+            return
+        new = {
+            "trd_id": np.fromiter((r.trd_id for r in rows), np.int64, n),
+            "prd_id": np.fromiter((r.prd_id for r in rows), np.int32, n),
+            "store": np.fromiter((self._store_code(r.store_cd) for r in rows), np.int16, n),
+            "quantity": np.fromiter((r.quantity for r in rows), np.int32, n),
+            "amount": np.fromiter((r.line_amount for r in rows), np.int64, n),
+            "ts": np.fromiter((_epoch(r.datetime) for r in rows), np.int64, n),
+        }
+        for r in rows:
+            self.names[r.prd_id] = r.prd_name
+        with self._lock:
+            capacity = len(self._cols["ts"])
+            if self.size + n > capacity:
+                # 容量は倍々で確保し、追記のたびに配列全体をコピーしない
+                capacity = max(self.size + n, capacity * 2, 1024)
+                for name, col in self._cols.items():
+                    grown = np.empty(capacity, col.dtype)
+                    grown[:self.size] = col[:self.size]
+                    self._cols[name] = grown
+            for name, values in new.items():
+                self._cols[name][self.size:self.size + n] = values
+            self.size += n
+
+    def _evict(self, now: datetime) -> None:
+        cutoff = _epoch(now - self.window)
+        with self._lock:
+            ts = self._cols["ts"][:self.size]
+            if not self.size or ts.min() >= cutoff:
+                return
+            keep = ts >= cutoff
+            self._cols = {name: np.ascontiguousarray(col[:self.size][keep]) for name, col in self._cols.items()}
+            self.size = len(self._cols["ts"])
+
+    def refresh(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Append receipts above the high-water mark; the first call loads the whole window."""
+        now = now or datetime.utcnow()
+        settled = now - timedelta(seconds=ANALYTICS_SETTLE)
+        start = now - self.window
+        last = self.last_trd_id
+        if last is None:
+            # 窓内で最小の ID の手前から読む（それより小さい ID はすべて窓より古い）。
+            # 窓内に伝票がなければ（休日明け・新規環境）全件が窓より古く確定済みなので最大 ID から
+            first = db.scalar(select(func.min(Transaction.trd_id)).where(Transaction.datetime >= start))
+            last = first - 1 if first is not None else db.scalar(select(func.max(Transaction.trd_id))) or 0
+        added = 0
+        while True:
+            # 日時では絞らない: ID 順に並べ、最初の未確定の伝票で高水位線を止める
+            batch = db.execute(
+                select(Transaction.trd_id, Transaction.datetime)
+                .where(Transaction.trd_id > last)
+                .order_by(Transaction.trd_id)
+                .limit(ANALYTICS_BATCH_SIZE)
+            ).all()
+            trd_ids = settled_prefix(batch, settled)
+            if not trd_ids:
+                break
+            # 窓の下限は毎回付ける（遅れて確定した古い伝票を読み込んで即捨てることのないように）
+            in_window = [trd_id for trd_id, stamped in batch[:len(trd_ids)] if stamped >= start]
+            if in_window:
+                rows = db.execute(
+                    select(
+                        Transaction.trd_id,
+                        Transaction.datetime,
+                        Transaction.store_cd,
+                        TransactionDetail.prd_id,
+                        TransactionDetail.prd_name,
+                        TransactionDetail.quantity,
+                        TransactionDetail.line_amount,
+                    )
+                    .join(TransactionDetail, TransactionDetail.trd_id == Transaction.trd_id)
+                    .where(Transaction.trd_id.in_(in_window))
+                ).all()
+                self._append(rows)
+                added += len(rows)
+            last = trd_ids[-1]
+            if len(trd_ids) < len(batch):
+                break
+        if self.last_trd_id is None:
+            self.loads += 1
+        self.last_trd_id = last
+        self._evict(now)
+        return added
+
+    def maybe_refresh(self, session_factory) -> None:
+        """Refresh at most every ``ANALYTICS_REFRESH`` seconds; concurrent callers use the current arrays."""
+        loaded = self.last_trd_id is not None
+        if loaded and time.monotonic() - self.last_refresh < ANALYTICS_REFRESH:
+            return
+        # 初回ロードだけは完了を待つ
+        if not self._refreshing.acquire(blocking=not loaded):
+            return
+        try:
+            if self.last_trd_id is not None and time.monotonic() - self.last_refresh < ANALYTICS_REFRESH:
+                return
+            with session_factory() as db:
+                self.refresh(db)
+            self.last_refresh = time.monotonic()
+        finally:
+            self._refreshing.release()
+
+    # -- 集計 -----------------------------------------------------------------
+    def _select(self, hours: float, store_cd: Optional[str], now: Optional[datetime] = None):
+        """Column views for lines in the last ``hours`` (optionally one store)."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            # ビューを取ってからロックを外す（追記は size 以降、削除は配列ごと差し替え）
+            cols = {name: col[:self.size] for name, col in self._cols.items()}
+            store = self._store_codes.get(store_cd) if store_cd is not None else None
+        if store_cd is not None and store is None:
+            return {name: col[:0] for name, col in cols.items()}
+        mask = cols["ts"] >= _epoch(now - timedelta(hours=hours))
+        if store is not None:
+            mask &= cols["store"] == store
+        return {name: col[mask] for name, col in cols.items()}
+
+    def top_products(self, hours: float, store_cd: Optional[str] = None, limit: int = 10, by: str = "quantity"):
+        cols = self._select(hours, store_cd)
+        if not len(cols["prd_id"]):
+            return []
+        # prd_id は連番なので、そのまま添字にして 1 パスで合計する
+        quantity = np.bincount(cols["prd_id"], weights=cols["quantity"])
+        amount = np.bincount(cols["prd_id"], weights=cols["amount"])
+        products = np.flatnonzero(quantity)
+        quantity, amount = quantity[products], amount[products]
+        key = quantity if by == "quantity" else amount
+        # 全件ソートせず上位 limit 件だけを取り出してから並べる
+        top = np.argpartition(-key, min(limit, len(key)) - 1)[:limit]
+        top = top[np.lexsort((products[top], -key[top]))]
+        return [
+            {
+                "prd_id": int(products[i]),
+                "name": self.names.get(int(products[i])),
+                "quantity": int(quantity[i]),
+                "amount": int(amount[i]),
+            }
+            for i in top
+        ]
+
+    def hourly_revenue(self, hours: float, store_cd: Optional[str] = None, now: Optional[datetime] = None):
+        """Revenue, quantity and receipts per hour (local business time), oldest first."""
+        now = now or datetime.utcnow()
+        cols = self._select(hours, store_cd, now)
+        offset = int(BUSINESS_DAY_UTC_OFFSET_HOURS * 3600)
+        first = (_epoch(now - timedelta(hours=hours)) + offset) // 3600
+        last = (_epoch(now) + offset) // 3600
+        buckets = (cols["ts"] + offset) // 3600 - first
+        n = int(last - first + 1)
+        revenue = np.bincount(buckets, weights=cols["amount"], minlength=n)
+        quantity = np.bincount(buckets, weights=cols["quantity"], minlength=n)
+        # 伝票数: 伝票ごとに最初の明細の時間帯だけを数える（1 伝票の明細は同じ時刻）
+        order = np.argsort(cols["trd_id"], kind="stable")
+        first_line = order[np.concatenate(([True], np.diff(cols["trd_id"][order]) != 0))] if len(order) else order
+        receipts = np.bincount(buckets[first_line], minlength=n)
+        return [
+            {
+                "hour": (_EPOCH + timedelta(hours=int(first + i))).isoformat(),
+                "revenue": int(revenue[i]),
+                "quantity": int(quantity[i]),
+                "receipts": int(receipts[i]),
+            }
+            for i in range(n)
+        ]
+
+    def pairs(self, hours: float, store_cd: Optional[str] = None, limit: int = 20, min_count: int = 2):
+        """Products bought together: receipt counts and lift for the most frequent pairs."""
+        cols = self._select(hours, store_cd)
+        if not len(cols["trd_id"]):
+            return []
+        # (trd_id, prd_id) を 1 つの int64 に詰めて重複を除く。並びは伝票ごとに商品の昇順になる
+        width = int(cols["prd_id"].max()) + 1
+        baskets = _sorted_unique(cols["trd_id"] * width + cols["prd_id"])
+        trd, prd = np.divmod(baskets, width)
+        receipts = int(np.count_nonzero(np.diff(trd))) + 1
+        # 同じ伝票内の i 番目と i+d 番目を組にする（d は最大の伝票明細数まで）
+        codes = []
+        d = 1
+        while d < len(trd):
+            same = trd[d:] == trd[:-d]
+            if not same.any():
+                break
+            codes.append(prd[:-d][same] * width + prd[d:][same])
+            d += 1
+        if not codes:
+            return []
+        pair_codes, counts = np.unique(np.concatenate(codes), return_counts=True)
+        keep = counts >= min_count
+        pair_codes, counts = pair_codes[keep], counts[keep]
+        if not len(counts):
+            return []
+        top = np.argpartition(-counts, min(limit, len(counts)) - 1)[:limit]
+        top = top[np.lexsort((pair_codes[top], -counts[top]))]
+        # 単品の出現伝票数（lift の分母）
+        support = np.bincount(prd)
+        result = []
+        for i in top:
+            a, b = divmod(int(pair_codes[i]), width)
+            together = int(counts[i])
+            result.append({
+                "prd_ids": [a, b],
+                "names": [self.names.get(a), self.names.get(b)],
+                "receipts": together,
+                "support": round(together / receipts, 4),
+                "lift": round(together * receipts / (int(support[a]) * int(support[b])), 3),
+            })
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            size, capacity = self.size, len(self._cols["ts"])
+            nbytes = sum(col.nbytes for col in self._cols.values())
+            oldest = int(self._cols["ts"][:size].min()) if size else None
+        return {
+            "lines": size,
+            "capacity": capacity,
+            "bytes": nbytes,
+            "bytes_per_line": round(nbytes / capacity, 1) if capacity else None,
+            "stores": len(self._stores),
+            "window_hours": self.window.total_seconds() / 3600,
+            "oldest": (_EPOCH + timedelta(seconds=oldest)).isoformat() if oldest is not None else None,
+            "last_trd_id": self.last_trd_id,
+            "loads": self.loads,
+        }
+
+
+sales_columns = SalesColumns()
@@ -0,0 +1,149 @@
+# backend/app/archive.py
+"""Move receipts of closed months from ``trd``/``trd_dtl`` to the archive tables.
+
+    python -m app.archive             # 締め済み月を移動
+    python -m app.archive --dry-run   # 対象件数だけ表示
+
+Each batch copies up to ``ARCHIVE_BATCH_SIZE`` receipts with
+``INSERT ... SELECT`` and deletes them from the hot tables in the same
+transaction, so an interrupted run leaves every receipt in exactly one place.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple, Type
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from .models import (
+    RollupState,
+    Transaction,
+    TransactionArchive,
+    TransactionDetail,
+    TransactionDetailArchive,
+)
+from .rollup import BUSINESS_DAY_UTC_OFFSET_HOURS, ROLLUP_MODE, STATE_NAME
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+# 当月を含めてこの月数分はホット表に残す（既定: 当月 + 前 2 か月）
+ARCHIVE_KEEP_MONTHS = int(os.getenv("ARCHIVE_KEEP_MONTHS", "3"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+# バッチ間の休止（秒）。本番中に流すときのレプリケーション・I/O 負荷を抑える
+ARCHIVE_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", "0.1"))
+
+# (ヘッダ, 明細) の組。新しい順に検索する
+HOT = (Transaction, TransactionDetail)
+ARCHIVE = (TransactionArchive, TransactionDetailArchive)
+Tables = Tuple[Type, Type]
+
+_HEADER_COLUMNS = [c.name for c in Transaction.__table__.columns]
+_DETAIL_COLUMNS = [c.name for c in TransactionDetail.__table__.columns]
+
+
+def archive_cutoff(now: Optional[datetime] = None, keep_months: int = ARCHIVE_KEEP_MONTHS) -> datetime:
+    """UTC instant where the oldest kept business month starts."""
+    offset = timedelta(hours=BUSINESS_DAY_UTC_OFFSET_HOURS)
+    local = (now or datetime.utcnow()) + offset
+    year, month = local.year, local.month - (keep_months - 1)
+    while month <= 0:
+        year, month = year - 1, month + 12
+    return datetime(year, month, 1) - offset
+
+
+# ---------------------------------------------------------------------------
+# 検索側（ホット + アーカイブを透過的に引く）
+# ---------------------------------------------------------------------------
+def newest_archived(db: Session) -> Optional[datetime]:
+    """Newest archived ``datetime``; hot-only queries skip the archive when they start after it."""
+    # 呼び出しごとに読む（IDX_TRD_ARC_DATETIME の末尾 1 件）。プロセス内でキャッシュすると、
+    # 別プロセスのジョブが動かした直後の伝票を API ワーカーが見落とす
+    return db.scalar(select(func.max(TransactionArchive.datetime)))
+
+
+def tables_for(db: Session, date_from: Optional[datetime] = None) -> List[Tables]:
+    """Hot tables, plus the archive when it may hold rows at or after ``date_from``."""
+    boundary = newest_archived(db)
+    if boundary is None or (date_from is not None and date_from > boundary):
+        return [HOT]
+    return [HOT, ARCHIVE]
+
+
+# ---------------------------------------------------------------------------
+# アーカイブジョブ
+# ---------------------------------------------------------------------------
+def _candidates(db: Session, cutoff: datetime, limit: int) -> List[int]:
+    conditions = [Transaction.datetime < cutoff]
+    if ROLLUP_MODE == "catchup":
+        # 集計に未反映の取引は動かさない（catch_up はホット表だけを見る）
+        high_water = db.scalar(select(RollupState.last_trd_id).where(RollupState.name == STATE_NAME)) or 0
+        conditions.append(Transaction.trd_id <= high_water)
+    return db.scalars(
+        select(Transaction.trd_id).where(*conditions).order_by(Transaction.trd_id).limit(limit)
+    ).all()
+
+
+def archive_batch(db: Session, trd_ids: List[int]) -> None:
+    """Copy ``trd_ids`` to the archive and delete them from the hot tables (one transaction)."""
+    db.execute(
+        insert(TransactionArchive).from_select(
+            _HEADER_COLUMNS,
+            select(*[Transaction.__table__.c[name] for name in _HEADER_COLUMNS]).where(
+                Transaction.trd_id.in_(trd_ids)
+            ),
+        )
+    )
+    db.execute(
+        insert(TransactionDetailArchive).from_select(
+            _DETAIL_COLUMNS,
+            select(*[TransactionDetail.__table__.c[name] for name in _DETAIL_COLUMNS]).where(
+                TransactionDetail.trd_id.in_(trd_ids)
+            ),
+        )
+    )
+    db.execute(delete(TransactionDetail).where(TransactionDetail.trd_id.in_(trd_ids)))
+    db.execute(delete(Transaction).where(Transaction.trd_id.in_(trd_ids)))
+    db.commit()
+
+
+def run(db: Session, cutoff: Optional[datetime] = None, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Archive every hot receipt older than ``cutoff``; returns how many were moved."""
+    cutoff = cutoff or archive_cutoff()
+    moved = 0
+    while True:
+        trd_ids = _candidates(db, cutoff, batch_size)
+        if not trd_ids:
+            break
+        archive_batch(db, trd_ids)
+        moved += len(trd_ids)
+        if ARCHIVE_BATCH_PAUSE:
+            time.sleep(ARCHIVE_BATCH_PAUSE)
+    return moved
+
+
+def main(argv=None) -> None:
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Move receipts of closed months to trd_archive")
+    parser.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    cutoff = archive_cutoff(keep_months=args.keep_months)
+    with SessionLocal() as db:
+        if args.dry_run:
+            count = db.scalar(select(func.count()).select_from(Transaction).where(Transaction.datetime < cutoff))
+            print(f"対象: {cutoff:%Y-%m-%d %H:%M} (UTC) より前の取引 {count} 件")
+            return
+        moved = run(db, cutoff, args.batch_size)
+    print(f"✓ {cutoff:%Y-%m-%d %H:%M} (UTC) より前の取引 {moved} 件をアーカイブしました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# backend/app/catalog.py
+"""In-process product catalog cache used by the scan lookup endpoint."""
+from __future__ import annotations
+
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Dict, Tuple, Union
+
+from .catalog_feed import current_version
+from .pricing import DEFAULT_TAX_DIV, price_in_tax
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "10000"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))  # 秒
+# catalog_state.version を見に行く間隔（秒）。他ワーカー・CLI 取込の変更をこの遅れで反映する
+CATALOG_VERSION_CHECK = float(os.getenv("CATALOG_VERSION_CHECK", "2"))
+
+
+@dataclass(frozen=True)
+class CachedProduct:
+    """Session-independent snapshot of a ``Product`` row.
+
+    The tax-inclusive price is computed once when the snapshot is built, and
+    the ``ProductOut`` JSON is encoded on first use and kept with it. A product
+    change replaces the snapshot, so neither can go stale.
+    """
+
+    prd_id: int
+    code: str
+    name: str
+    price: int
+    tax_div: str = DEFAULT_TAX_DIV
+    price_in_tax: int = field(init=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "price_in_tax", price_in_tax(self.price, self.tax_div))
+
+    @classmethod
+    def from_row(cls, product) -> "CachedProduct":
+        return cls(
+            prd_id=product.prd_id,
+            code=product.code,
+            name=product.name,
+            price=product.price,
+            tax_div=product.tax_div,
+        )
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "id": self.prd_id,
+            "code": self.code,
+            "name": self.name,
+            "price_ex_tax": self.price,
+            "price_in_tax": self.price_in_tax,
+            "tax_div": self.tax_div,
+        }
+
+    @cached_property
+    def body(self) -> bytes:
+        """``ProductOut`` as JSON bytes (same encoding as FastAPI's ``JSONResponse``)."""
+        return json.dumps(self.as_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class _Ambiguous:
+    """Marker for a 6-digit suffix shared by more than one product."""
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return "AMBIGUOUS"
+
+
+AMBIGUOUS = _Ambiguous()
+MISS = object()
+
+_Value = Union[CachedProduct, _Ambiguous, None]
+
+
+class ProductCatalogCache:
+    """Bounded LRU of products indexed by full code and by 6-digit suffix.
+
+    Negative results (``None``) are cached as well, so repeated scans of an
+    unknown barcode do not hit MySQL either. ``invalidate()`` bumps the
+    version; entries written under an older version are treated as misses.
+    ``maybe_sync()`` invalidates when ``catalog_state.version`` has moved,
+    so changes made by other workers or the import CLI are seen as well.
+    """
+
+    def __init__(self, max_entries: int = CATALOG_CACHE_SIZE, ttl: float = CATALOG_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.catalog_version = None  # 最後に確認した catalog_state.version
+        self._checked_at = float("-inf")
+        self._by_code: "OrderedDict[str, Tuple[float, int, _Value]]" = OrderedDict()
+        self._by_suffix: "OrderedDict[str, Tuple[float, int, _Value]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # -- lookup ------------------------------------------------------------
+    def get(self, code: str):
+        """Return the cached value for ``code`` or ``MISS``."""
+        index = self._index_for(code)
+        now = time.monotonic()
+        with self._lock:
+            entry = index.get(code)
+            if entry is not None:
+                expires_at, version, value = entry
+                if version == self.version and expires_at > now:
+                    index.move_to_end(code)
+                    self.hits += 1
+                    return value
+                del index[code]
+            self.misses += 1
+            return MISS
+
+    def put(self, code: str, value: _Value) -> None:
+        """Store a lookup result for ``code`` (product, ``AMBIGUOUS`` or ``None``)."""
+        index = self._index_for(code)
+        with self._lock:
+            index[code] = (time.monotonic() + self.ttl, self.version, value)
+            index.move_to_end(code)
+            self._evict()
+            # 下6桁で一意に決まった商品はフルコードでも引けるようにする
+            # （逆方向は同じ下6桁の別商品があり得るので DB 側で判定する）
+            if isinstance(value, CachedProduct) and index is self._by_suffix:
+                self._by_code[value.code] = (time.monotonic() + self.ttl, self.version, value)
+                self._evict()
+
+    def maybe_sync(self, db) -> None:
+        """Invalidate when the catalog version changed (checked every ``CATALOG_VERSION_CHECK`` s)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < CATALOG_VERSION_CHECK:
+                return
+            self._checked_at = now  # 同時に来た他のリクエストは確認を省く
+        version = current_version(db)
+        if self.catalog_version is not None and version != self.catalog_version:
+            self.invalidate()
+        self.catalog_version = version
+
+    def invalidate(self) -> None:
+        """Drop every entry (call after products are created or changed)."""
+        with self._lock:
+            self.version += 1
+            self._by_code.clear()
+            self._by_suffix.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "catalog_version": self.catalog_version,
+                "entries": len(self._by_code) + len(self._by_suffix),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # -- internal ----------------------------------------------------------
+    def _index_for(self, code: str):
+        return self._by_suffix if len(code) == 6 else self._by_code
+
+    def _evict(self) -> None:
+        while len(self._by_code) + len(self._by_suffix) > self.max_entries:
+            # 大きい方のインデックスから最も古いエントリを追い出す
+            victim = self._by_code if len(self._by_code) >= len(self._by_suffix) else self._by_suffix
+            victim.popitem(last=False)
+            self.evictions += 1
+
+
+product_cache = ProductCatalogCache()
+
@@ -0,0 +1,175 @@
+# backend/app/catalog_feed.py
+"""Versioned product catalog feed for terminals (snapshot + deltas).
+
+Every write to ``prd_mst`` appends to ``prd_change_log`` under a version
+taken from the single ``catalog_state`` row. The ``UPDATE`` on that row
+serializes catalog writers until commit, so versions become visible in
+order and ``version > since`` never skips a change.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from .models import CatalogState, Product, ProductChange
+
+OP_UPSERT = "U"
+OP_DELETE = "D"
+
+PriceInTax = Callable[[int, str], int]  # (税抜価格, 税区分) -> 税込価格
+
+
+# ---------------------------------------------------------------------------
+# 変更履歴の記録
+# ---------------------------------------------------------------------------
+def _reserve_versions(conn, count: int) -> int:
+    """Advance ``catalog_state.version`` by ``count``; returns the first reserved version."""
+    result = conn.execute(
+        update(CatalogState).where(CatalogState.id == 1).values(version=CatalogState.version + count)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(CatalogState).values(id=1, version=count))
+    return conn.execute(select(CatalogState.version).where(CatalogState.id == 1)).scalar_one() - count + 1
+
+
+def record_changes(conn, changes: Iterable[Tuple[int, str, str]]) -> None:
+    """Append ``(prd_id, code, op)`` rows to the change log (no commit)."""
+    changes = list(changes)
+    if not changes:
+        return
+    first = _reserve_versions(conn, len(changes))
+    now = datetime.utcnow()
+    conn.execute(
+        insert(ProductChange),
+        [
+            {"version": first + i, "prd_id": prd_id, "code": code, "op": op, "changed_at": now}
+            for i, (prd_id, code, op) in enumerate(changes)
+        ],
+    )
+
+
+def record_upserts(db: Session, codes: Iterable[str]) -> None:
+    """Log Core-level upserts (e.g. product import) that bypass the ORM events."""
+    rows = db.execute(select(Product.prd_id, Product.code).where(Product.code.in_(list(codes)))).all()
+    record_changes(db.connection(), ((prd_id, code, OP_UPSERT) for prd_id, code in rows))
+
+
+@event.listens_for(Session, "after_flush")
+def _log_product_flush(session, flush_context):
+    changes = [
+        (obj.prd_id, obj.code, OP_UPSERT)
+        for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Product) and (obj in session.new or session.is_modified(obj))
+    ]
+    changes += [(obj.prd_id, obj.code, OP_DELETE) for obj in session.deleted if isinstance(obj, Product)]
+    if changes:
+        record_changes(session.connection(), changes)
+
+
+# ---------------------------------------------------------------------------
+# 配信
+# ---------------------------------------------------------------------------
+def current_version(db: Session) -> int:
+    return db.scalar(select(CatalogState.version).where(CatalogState.id == 1)) or 0
+
+
+def _product_dict(row, price_in_tax: PriceInTax) -> dict:
+    return {
+        "id": row.prd_id,
+        "code": row.code,
+        "name": row.name,
+        "price_ex_tax": row.price,
+        "price_in_tax": price_in_tax(row.price, row.tax_div),
+        "tax_div": row.tax_div,
+    }
+
+
+class SnapshotCache:
+    """Keeps the encoded snapshot of the latest version (plain and gzip)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._bodies: Dict[bool, bytes] = {}
+
+    def get(self, db: Session, price_in_tax: PriceInTax) -> Tuple[int, Dict[bool, bytes]]:
+        # バージョンと全件を同じトランザクション（同じスナップショット）で読む
+        version = current_version(db)
+        with self._lock:
+            if self._version == version:
+                return version, self._bodies
+        rows = db.execute(
+            select(Product.prd_id, Product.code, Product.name, Product.price, Product.tax_div)
+            .order_by(Product.prd_id)
+        ).all()
+        body = json.dumps(
+            {"version": version, "products": [_product_dict(r, price_in_tax) for r in rows]},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        bodies = {False: body, True: gzip.compress(body, compresslevel=6)}
+        with self._lock:
+            if self._version is None or version >= self._version:
+                self._version, self._bodies = version, bodies
+        return version, bodies
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version, self._bodies = None, {}
+
+
+snapshot_cache = SnapshotCache()
+
+
+def changes_since(db: Session, since: int, limit: int, price_in_tax: PriceInTax) -> dict:
+    """Latest state of every product changed after ``since`` (at most ``limit`` log entries).
+
+    ``reset`` tells the terminal to reload the snapshot instead (unknown version).
+    """
+    version = current_version(db)
+    if since > version or since < 0:
+        return {"version": version, "reset": True, "has_more": False, "upserts": [], "deletes": []}
+    if since == version:
+        return {"version": since, "reset": False, "has_more": False, "upserts": [], "deletes": []}
+
+    log = db.execute(
+        select(ProductChange.version, ProductChange.prd_id, ProductChange.code)
+        .where(ProductChange.version > since)
+        .order_by(ProductChange.version)
+        .limit(limit)
+    ).all()
+    if not log:
+        return {"version": version, "reset": False, "has_more": False, "upserts": [], "deletes": []}
+
+    # 同じ商品の変更は最新の状態 1 件にまとめる
+    codes: Dict[int, str] = {}
+    for _, prd_id, code in log:
+        codes[prd_id] = code
+    current = {
+        r.prd_id: r
+        for r in db.execute(
+            select(Product.prd_id, Product.code, Product.name, Product.price, Product.tax_div)
+            .where(Product.prd_id.in_(codes))
+        )
+    }
+    upserts: List[dict] = []
+    deletes: List[dict] = []
+    for prd_id, code in codes.items():
+        if prd_id in current:
+            upserts.append(_product_dict(current[prd_id], price_in_tax))
+        else:
+            deletes.append({"id": prd_id, "code": code})
+    last = log[-1].version
+    return {
+        "version": last,
+        "reset": False,
+        "has_more": last < version,
+        "upserts": upserts,
+        "deletes": deletes,
+    }
@@ -1,10 +1,14 @@
 # backend/app/db.py
 from sqlalchemy import create_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.engine import URL
+from sqlalchemy.engine import URL, make_url
 import os
+import ssl
 from dotenv import load_dotenv, find_dotenv
 
+from .pool_stats import PoolStats, instrumented_pool_class
+
 ENV_FILE = os.getenv("ENV_FILE", ".env.production")
 load_dotenv(find_dotenv(ENV_FILE), override=False)
 
@@ -23,6 +27,19 @@ CA_CERT = "/etc/ssl/certs/digicert.pem"  # Dockerfile で配置したパス
 # Allow full connection string via DATABASE_URL
 DATABASE_URL_ENV = os.getenv("DATABASE_URL")
 
+# 読み取り専用レプリカ（未設定ならすべてプライマリ）
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+
+# 非同期モード（async エンジン + async def ハンドラ）
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+# ---------- コネクションプール ----------
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))     # 秒（空き待ちの上限）
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))     # 秒（-1 で無効）
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
 
 if DATABASE_URL_ENV:
     # Use provided connection string directly
@@ -49,7 +66,8 @@ else:
     #   →   *.mysql.database.azure.com で判定
     if DB_HOST.endswith(".mysql.database.azure.com"):
         # Use direct parameter mapping that works in PyMySQL test
-        DATABASE_URL = str(BASE_DSN)
+        # （URL オブジェクトのまま渡す。str() はパスワードを *** に伏せてしまう）
+        DATABASE_URL = BASE_DSN
         CONNECT_ARGS = {
             "ssl_ca": CA_CERT,
             "ssl_verify_cert": True,
@@ -57,7 +75,7 @@ else:
         }
     else:
         # ローカル開発：SSL 無し
-        DATABASE_URL = str(BASE_DSN)
+        DATABASE_URL = BASE_DSN
         CONNECT_ARGS = {}
 
 # ────────────────────────────────
@@ -67,12 +85,30 @@ else:
 print(f"🔧 DATABASE_URL: {DATABASE_URL}")
 print(f"🔧 CONNECT_ARGS: {CONNECT_ARGS}")
 
+
+def _pool_kwargs(url, pool_class, stats):
+    kwargs = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # SQLite はドライバ既定のプールのまま（サイズ指定を受け付けないものがある）
+    if make_url(url).get_backend_name() != "sqlite":
+        kwargs.update(
+            poolclass=instrumented_pool_class(pool_class, stats),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return kwargs
+
+
+pool_stats = PoolStats("primary")
+
 engine = create_engine(
     DATABASE_URL,
     echo=False,
     future=True,
     connect_args=CONNECT_ARGS,
+    **_pool_kwargs(DATABASE_URL, QueuePool, pool_stats),
 )
+pool_stats.attach(engine)
 
 SessionLocal = sessionmaker(
     bind=engine,
@@ -80,4 +116,97 @@ SessionLocal = sessionmaker(
     autocommit=False,
 )
 
+# ────────────────────────────────
+# SQLAlchemy (async) ― DB_ASYNC=true のときだけ生成
+# ────────────────────────────────
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_url(url):
+    """Map the sync DSN onto its asyncio driver (PyMySQL → aiomysql)."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+def _async_connect_args(connect_args=CONNECT_ARGS):
+    # aiomysql は PyMySQL の ssl_ca / ssl_verify_* を受け付けないので SSLContext を渡す
+    if connect_args:
+        return {"ssl": ssl.create_default_context(cafile=CA_CERT)}
+    return {}
+
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_pool_stats = PoolStats("primary_async")
+
+    async_engine = create_async_engine(
+        _async_url(DATABASE_URL),
+        echo=False,
+        connect_args=_async_connect_args(),
+        **_pool_kwargs(DATABASE_URL, AsyncAdaptedQueuePool, async_pool_stats),
+    )
+    async_pool_stats.attach(async_engine.sync_engine)
+
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+else:
+    async_engine = None
+    async_pool_stats = None
+    AsyncSessionLocal = None
+
+# ────────────────────────────────
+# 読み取りレプリカ ― REPLICA_DATABASE_URL があるときだけ生成（振り分けは app.replica）
+# ────────────────────────────────
+if REPLICA_DATABASE_URL:
+    REPLICA_CONNECT_ARGS = (
+        {"ssl": {"ca": CA_CERT}} if "mysql.database.azure.com" in REPLICA_DATABASE_URL else {}
+    )
+    print(f"🔧 REPLICA_DATABASE_URL: {make_url(REPLICA_DATABASE_URL)}")
+
+    replica_pool_stats = PoolStats("replica")
+    replica_engine = create_engine(
+        REPLICA_DATABASE_URL,
+        echo=False,
+        future=True,
+        connect_args=REPLICA_CONNECT_ARGS,
+        **_pool_kwargs(REPLICA_DATABASE_URL, QueuePool, replica_pool_stats),
+    )
+    replica_pool_stats.attach(replica_engine)
+    ReplicaSessionLocal = sessionmaker(
+        bind=replica_engine, autoflush=False, autocommit=False, info={"replica": True}
+    )
+
+    if DB_ASYNC:
+        async_replica_pool_stats = PoolStats("replica_async")
+        async_replica_engine = create_async_engine(
+            _async_url(REPLICA_DATABASE_URL),
+            echo=False,
+            connect_args=_async_connect_args(REPLICA_CONNECT_ARGS),
+            **_pool_kwargs(REPLICA_DATABASE_URL, AsyncAdaptedQueuePool, async_replica_pool_stats),
+        )
+        async_replica_pool_stats.attach(async_replica_engine.sync_engine)
+        AsyncReplicaSessionLocal = async_sessionmaker(
+            bind=async_replica_engine, autoflush=False, expire_on_commit=False, info={"replica": True}
+        )
+    else:
+        async_replica_engine = None
+        async_replica_pool_stats = None
+        AsyncReplicaSessionLocal = None
+else:
+    replica_engine = None
+    replica_pool_stats = None
+    ReplicaSessionLocal = None
+    async_replica_engine = None
+    async_replica_pool_stats = None
+    AsyncReplicaSessionLocal = None
+
 Base = declarative_base()
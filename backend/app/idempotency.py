@@ -0,0 +1,146 @@
+# backend/app/idempotency.py
+"""Idempotency-Key support for POST /purchase.
+
+Keys are persisted in ``purchase_idem`` in the same transaction as the
+receipt. The key row is inserted *before* ``trd``, so a concurrent duplicate
+blocks on the unique index until the first request commits (InnoDB) and then
+reads its stored response. A bounded in-process LRU answers recent retries
+without touching MySQL, and duplicates arriving at the same worker wait on a
+per-key lock instead of racing to the database.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import PurchaseIdempotency
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+MAX_KEY_LENGTH = 64
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+
+def request_hash(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Bounded LRU of ``key -> (request_hash, response)`` plus per-key in-flight locks."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[str, dict]]" = OrderedDict()
+        self._inflight: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, req_hash: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        if entry[0] != req_hash:
+            raise IdempotencyConflict(key)
+        return entry[1]
+
+    def put(self, key: str, req_hash: str, response: dict) -> None:
+        with self._lock:
+            self._entries[key] = (req_hash, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @contextmanager
+    def inflight(self, key: str):
+        """Serialize requests carrying the same key within this process."""
+        with self._lock:
+            slot = self._inflight.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "inflight": len(self._inflight),
+            }
+
+
+idempotency_store = IdempotencyStore()
+
+
+def _stored_response(row: PurchaseIdempotency, req_hash: str) -> Optional[dict]:
+    if row.request_hash != req_hash:
+        raise IdempotencyConflict(row.idem_key)
+    return json.loads(row.response) if row.response else None
+
+
+def claim(db: Session, key: str, req_hash: str) -> Tuple[Optional[PurchaseIdempotency], Optional[dict]]:
+    """Reserve ``key`` inside the current transaction.
+
+    Returns ``(row, None)`` when this request owns the key (fill ``row`` and
+    commit with the receipt), or ``(None, response)`` for a duplicate.
+    """
+    cached = idempotency_store.get(key, req_hash)
+    if cached is not None:
+        return None, cached
+
+    existing = db.get(PurchaseIdempotency, key)
+    if existing is not None and existing.response:
+        response = _stored_response(existing, req_hash)
+        idempotency_store.put(key, req_hash, response)
+        return None, response
+
+    row = PurchaseIdempotency(idem_key=key, request_hash=req_hash)
+    db.add(row)
+    try:
+        # 同じキーの未コミット行があれば、ここで相手のコミットまで待たされる
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        winner = db.get(PurchaseIdempotency, key, populate_existing=True)
+        response = _stored_response(winner, req_hash) if winner is not None else None
+        if response is None:
+            raise
+        idempotency_store.put(key, req_hash, response)
+        return None, response
+    return row, None
+
+
+def complete(row: PurchaseIdempotency, trd_id: int, response: dict) -> None:
+    """Attach the receipt to the claimed key (committed by the caller)."""
+    row.trd_id = trd_id
+    row.response = json.dumps(response)
+
+
+def remember(row: PurchaseIdempotency, response: dict) -> None:
+    """Publish a committed response to the LRU."""
+    idempotency_store.put(row.idem_key, row.request_hash, response)
@@ -4,6 +4,8 @@ import time
 import pymysql
 from urllib.parse import urlparse
 
+from app.pricing import DEFAULT_TAX_DIV, TAX_RATES
+
 # Load environment configuration
 from dotenv import load_dotenv, find_dotenv
 
@@ -11,6 +13,10 @@ from dotenv import load_dotenv, find_dotenv
 ENV_FILE = os.getenv("ENV_FILE", ".env.production")
 load_dotenv(find_dotenv(ENV_FILE), override=False)
 
+# スキーマ定義（create_tables / migrate_schema / app.models）を変えたら必ず上げる。
+# 起動時はこの値が schema_version に記録済みなら DDL を丸ごと省略する
+SCHEMA_VERSION = 4
+
 print("DEBUG DB_USER:", os.getenv("DB_USER"))
 print("DEBUG DB_PASSWORD:", os.getenv("DB_PASSWORD"))
 print("DEBUG DATABASE_URL:", os.getenv("DATABASE_URL"))
@@ -178,6 +184,120 @@ def create_tables():
         conn.close()
 
 
+def create_model_tables():
+    """Create tables defined in app.models that do not exist yet (sales_daily etc.)"""
+    from app.db import Base, engine
+    import app.models  # noqa: F401  (モデルを Base.metadata に登録)
+
+    Base.metadata.create_all(engine, checkfirst=True)
+    print("✓ モデル定義のテーブルを確認（または作成）しました。")
+
+
+def _table_exists(cursor, database, table):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+        (database, table),
+    )
+    return cursor.fetchone() is not None
+
+
+def _add_column_if_missing(cursor, database, table, column, definition):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (database, table, column),
+    )
+    if cursor.fetchone():
+        return
+    cursor.execute(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {definition}")
+    print(f"✓ 列を追加しました: {table}.{column}")
+
+
+def _add_index_if_missing(cursor, database, table, index, definition):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (database, table, index),
+    )
+    if cursor.fetchone():
+        return
+    cursor.execute(f"ALTER TABLE `{table}` ADD INDEX `{index}` {definition}")
+    print(f"✓ 索引を追加しました: {table}.{index}")
+
+
+def _add_check_if_missing(cursor, database, table, name, expression):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.TABLE_CONSTRAINTS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND CONSTRAINT_NAME = %s AND CONSTRAINT_TYPE = 'CHECK'",
+        (database, table, name),
+    )
+    if cursor.fetchone():
+        return
+    cursor.execute(f"ALTER TABLE `{table}` ADD CONSTRAINT `{name}` CHECK ({expression})")
+    print(f"✓ 制約を追加しました: {table}.{name}")
+
+
+def migrate_schema():
+    """Bring existing tables up to the current models (idempotent)"""
+    host = os.getenv("DB_HOST", "localhost")
+    port = int(os.getenv("DB_PORT", "3306"))
+    user = os.getenv("DB_USER", "root")
+    password = os.getenv("DB_PASSWORD", "")
+    database = os.getenv("DB_NAME", "pos_app_db")
+
+    # SSL config for Azure
+    ssl_config = {}
+    if host.endswith('.mysql.database.azure.com'):
+        ssl_config = {
+            'ssl_ca': '/etc/ssl/certs/digicert.pem',
+            'ssl_verify_cert': True,
+            'ssl_verify_identity': True
+        }
+
+    conn = pymysql.connect(
+        host=host,
+        user=user,
+        password=password,
+        port=port,
+        database=database,
+        **ssl_config
+    )
+
+    try:
+        with conn.cursor() as cursor:
+            if _table_exists(cursor, database, "prd_mst"):
+                # 短縮コード（下6桁）検索用の生成列と索引
+                _add_column_if_missing(
+                    cursor, database, "prd_mst", "CODE_SUFFIX",
+                    "CHAR(6) AS (SUBSTR(`CODE`, -6)) STORED AFTER `CODE`",
+                )
+                _add_index_if_missing(
+                    cursor, database, "prd_mst", "IDX_PRD_CODE_SUFFIX", "(`CODE_SUFFIX`)"
+                )
+                # 税区分（既存商品は標準税率）
+                _add_column_if_missing(
+                    cursor, database, "prd_mst", "TAX_DIV", "CHAR(2) NOT NULL DEFAULT '10' AFTER `PRICE`"
+                )
+                # 未知の税区分は標準税率に寄せてから CHECK 制約を付ける（既存の不正値で ALTER が失敗しないように）
+                allowed = ", ".join(f"'{div}'" for div in TAX_RATES)
+                if cursor.execute(f"UPDATE prd_mst SET TAX_DIV = '{DEFAULT_TAX_DIV}' WHERE TAX_DIV NOT IN ({allowed})"):
+                    print(f"⚠️  未知の税区分を {DEFAULT_TAX_DIV} に補正しました: {cursor.rowcount} 件")
+                _add_check_if_missing(cursor, database, "prd_mst", "CHK_PRD_TAX_DIV", f"`TAX_DIV` IN ({allowed})")
+            if _table_exists(cursor, database, "trd"):
+                # 取引一覧（キーセットページング）用の複合索引
+                for index, columns in (
+                    ("IDX_TRD_DATETIME", "(`datetime`, `trd_id`)"),
+                    ("IDX_TRD_STORE_DATETIME", "(`store_cd`, `datetime`, `trd_id`)"),
+                    ("IDX_TRD_STORE_POS_DATETIME", "(`store_cd`, `pos_no`, `datetime`, `trd_id`)"),
+                    ("IDX_TRD_EMP_DATETIME", "(`emp_cd`, `datetime`, `trd_id`)"),
+                ):
+                    _add_index_if_missing(cursor, database, "trd", index, columns)
+        conn.commit()
+        print("✓ スキーマ移行を確認しました。")
+    finally:
+        conn.close()
+
+
 def insert_initial_products():
     """Insert initial products using direct PyMySQL connection"""
     host = os.getenv("DB_HOST", "localhost")
@@ -235,20 +355,102 @@ def insert_initial_products():
         conn.close()
 
 
+def _ssl_config(host):
+    if host.endswith('.mysql.database.azure.com'):
+        return {
+            'ssl_ca': '/etc/ssl/certs/digicert.pem',
+            'ssl_verify_cert': True,
+            'ssl_verify_identity': True
+        }
+    return {}
+
+
+def schema_is_current():
+    """One connection + one query: has main() already completed for SCHEMA_VERSION?"""
+    host = os.getenv("DB_HOST", "localhost")
+    try:
+        conn = pymysql.connect(
+            host=host,
+            user=os.getenv("DB_USER", "root"),
+            password=os.getenv("DB_PASSWORD", ""),
+            port=int(os.getenv("DB_PORT", "3306")),
+            database=os.getenv("DB_NAME", "pos_app_db"),
+            connect_timeout=5,
+            **_ssl_config(host)
+        )
+    except pymysql.MySQLError as e:
+        print(f"⚠️  スキーマ確認用の接続に失敗しました: {e}")
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT version FROM schema_version WHERE id = 1")
+            row = cursor.fetchone()
+        return row is not None and row[0] >= SCHEMA_VERSION
+    except pymysql.MySQLError:
+        # schema_version がまだ無い（初回起動）
+        return False
+    finally:
+        conn.close()
+
+
+def record_schema_version():
+    host = os.getenv("DB_HOST", "localhost")
+    conn = pymysql.connect(
+        host=host,
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", ""),
+        port=int(os.getenv("DB_PORT", "3306")),
+        database=os.getenv("DB_NAME", "pos_app_db"),
+        **_ssl_config(host)
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                " id INT PRIMARY KEY, version INT NOT NULL, applied_at DATETIME NOT NULL)"
+            )
+            cursor.execute(
+                "INSERT INTO schema_version (id, version, applied_at) VALUES (1, %s, UTC_TIMESTAMP())"
+                " ON DUPLICATE KEY UPDATE version = VALUES(version), applied_at = VALUES(applied_at)",
+                (SCHEMA_VERSION,),
+            )
+        conn.commit()
+        print(f"✓ スキーマバージョン {SCHEMA_VERSION} を記録しました。")
+    finally:
+        conn.close()
+
+
+def ensure_schema():
+    """Startup entry point: skip everything when the schema is already current."""
+    started = time.monotonic()
+    if schema_is_current():
+        print(f"✓ スキーマは最新です（v{SCHEMA_VERSION}、確認 {time.monotonic() - started:.2f}s）。初期化を省略します。")
+        return
+    main()
+
+
+class DatabaseUnavailable(RuntimeError):
+    """The database could not be reached after the connection retries."""
+
+
 def main():
     print("🚀 Starting Azure MySQL database initialization...")
     
     # Test connection first
+    # exit() ではなく例外にする（gunicorn の on_starting や /init から呼ばれてもプロセスを落とさない）
     if not test_connection():
         print("❌ Cannot proceed with database initialization - connection failed")
-        exit(1)
+        raise DatabaseUnavailable("database connection failed")
     
     print("✅ Database connection test passed")
     
     try:
         create_database_if_not_exists()
         create_tables()
+        migrate_schema()
+        create_model_tables()
         insert_initial_products()
+        record_schema_version()
         print("🎉 Database initialization completed successfully!")
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
@@ -256,4 +458,13 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+
+    # --if-needed: スキーマが最新なら接続確認・DDL・シードをすべて省略
+    try:
+        if "--if-needed" in sys.argv[1:]:
+            ensure_schema()
+        else:
+            main()
+    except DatabaseUnavailable:
+        sys.exit(1)
@@ -0,0 +1,398 @@
+# backend/app/journal.py
+"""Write-behind purchase journal (``PURCHASE_WRITE_MODE=journal``).
+
+Accepted purchases are appended to a local SQLite file in WAL mode
+(``synchronous=FULL``, so an acknowledged receipt survives a crash) and a
+background flusher group-commits them into ``trd``/``trd_dtl``.
+
+Exactly-once: every receipt is written to MySQL together with a
+``purchase_idem`` row keyed by its Idempotency-Key (or ``journal:<id>``).
+After a crash between the MySQL commit and the journal update, the flusher
+finds the key already present and only marks the entry as flushed.
+
+Only one process per journal file flushes at a time (``fcntl`` lock on
+``<path>.lock``); the other workers keep appending and take over if the
+leader dies.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError, OperationalError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .models import PurchaseIdempotency
+
+try:
+    import fcntl
+except ImportError:  # Windows（ローカル開発）はプロセス 1 つ前提
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+# direct  : リクエスト内で MySQL にコミット（従来どおり）
+# journal : ローカルジャーナルに追記して 202 を返し、バックグラウンドでまとめてコミット
+PURCHASE_WRITE_MODE = os.getenv("PURCHASE_WRITE_MODE", "direct")
+# コンテナでは永続ボリューム上を指定すること
+PURCHASE_JOURNAL_PATH = os.getenv("PURCHASE_JOURNAL_PATH", "purchase_journal.db")
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "200"))
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.05"))  # 秒
+JOURNAL_RETRY_BACKOFF_MAX = float(os.getenv("JOURNAL_RETRY_BACKOFF_MAX", "30"))
+JOURNAL_RETENTION_HOURS = float(os.getenv("JOURNAL_RETENTION_HOURS", "24"))
+
+JOURNAL_ENABLED = PURCHASE_WRITE_MODE == "journal"
+
+PENDING = "pending"
+FLUSHED = "flushed"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+    receipt_id   TEXT NOT NULL UNIQUE,
+    idem_key     TEXT NOT NULL UNIQUE,
+    request_hash TEXT NOT NULL,
+    data         TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    trd_id       INTEGER,
+    error        TEXT,
+    created_at   REAL NOT NULL,
+    flushed_at   REAL
+);
+CREATE INDEX IF NOT EXISTS idx_journal_status ON journal (status, seq);
+"""
+
+
+@dataclass
+class JournalEntry:
+    """One accepted receipt: ``data`` holds the header, priced items and totals."""
+
+    seq: int
+    receipt_id: str
+    idem_key: str
+    request_hash: str
+    data: dict
+    status: str = PENDING
+    trd_id: Optional[int] = None
+    error: Optional[str] = None
+
+    def response(self, trd_id: int) -> dict:
+        """The ``PurchaseResponse`` body replayed for this receipt's key."""
+        return {
+            "success": True,
+            "transaction_id": trd_id,
+            "total_amount": self.data["header"]["total_amt"],
+            "total_amount_ex": self.data["header"]["total_amt_ex"],
+        }
+
+
+def encode_header(header: dict) -> dict:
+    return {**header, "datetime": header["datetime"].isoformat()}
+
+
+def decode_header(header: dict) -> dict:
+    return {**header, "datetime": datetime.fromisoformat(header["datetime"])}
+
+
+class PurchaseJournal:
+    def __init__(self, path: str = PURCHASE_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = self._connect()
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # -- 受付 ---------------------------------------------------------------
+    def append(self, idem_key: Optional[str], request_hash: str, data: dict) -> Tuple[JournalEntry, bool]:
+        """Durably record an accepted receipt; returns ``(entry, duplicate)``.
+
+        A repeated Idempotency-Key returns the entry recorded the first time.
+        """
+        receipt_id = uuid.uuid4().hex
+        key = idem_key or f"journal:{receipt_id}"
+        with self._lock:
+            try:
+                cur = self._conn.execute(
+                    "INSERT INTO journal (receipt_id, idem_key, request_hash, data, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (receipt_id, key, request_hash, json.dumps(data), time.time()),
+                )
+            except sqlite3.IntegrityError:
+                row = self._conn.execute("SELECT * FROM journal WHERE idem_key = ?", (key,)).fetchone()
+                return self._entry(row), True
+        return JournalEntry(cur.lastrowid, receipt_id, key, request_hash, data), False
+
+    def get(self, receipt_id: str) -> Optional[JournalEntry]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM journal WHERE receipt_id = ?", (receipt_id,)).fetchone()
+        return self._entry(row) if row else None
+
+    # -- フラッシュ ---------------------------------------------------------
+    def pending(self, limit: int) -> List[JournalEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM journal WHERE status = ? ORDER BY seq LIMIT ?", (PENDING, limit)
+            ).fetchall()
+        return [self._entry(r) for r in rows]
+
+    def mark_flushed(self, done: List[Tuple[int, int]]) -> None:
+        """``done`` is a list of ``(seq, trd_id)``."""
+        if not done:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE journal SET status = ?, trd_id = ?, error = NULL, flushed_at = ? WHERE seq = ?",
+                [(FLUSHED, trd_id, now, seq) for seq, trd_id in done],
+            )
+
+    def mark_failed(self, seq: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE journal SET status = ?, error = ? WHERE seq = ?", (FAILED, error[:500], seq)
+            )
+
+    def prune(self, retention_hours: float = JOURNAL_RETENTION_HOURS) -> int:
+        cutoff = time.time() - retention_hours * 3600
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM journal WHERE status = ? AND flushed_at < ?", (FLUSHED, cutoff)
+            ).rowcount
+
+    def backlog(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM journal GROUP BY status").fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM journal WHERE status = ?", (PENDING,)
+            ).fetchone()[0]
+        return {
+            "pending": counts.get(PENDING, 0),
+            "failed": counts.get(FAILED, 0),
+            "flushed_retained": counts.get(FLUSHED, 0),
+            "oldest_pending_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> JournalEntry:
+        return JournalEntry(
+            seq=row["seq"],
+            receipt_id=row["receipt_id"],
+            idem_key=row["idem_key"],
+            request_hash=row["request_hash"],
+            data=json.loads(row["data"]),
+            status=row["status"],
+            trd_id=row["trd_id"],
+            error=row["error"],
+        )
+
+
+# ---------------------------------------------------------------------------
+# バックグラウンドフラッシャ
+# ---------------------------------------------------------------------------
+def _is_transient(exc: SQLAlchemyError) -> bool:
+    """Connection-level failures are retried; anything else is a bad entry."""
+    return isinstance(exc, OperationalError) or (isinstance(exc, DBAPIError) and exc.connection_invalidated)
+
+
+# (db, entries) -> trd_ids。trd / trd_dtl / 集計を書き込む（コミットしない）
+PersistFn = Callable[[Session, List[JournalEntry]], List[int]]
+
+
+class JournalFlusher(threading.Thread):
+    def __init__(self, journal: PurchaseJournal, session_factory, persist: PersistFn):
+        super().__init__(name="purchase-journal-flusher", daemon=True)
+        self.journal = journal
+        self.session_factory = session_factory
+        self.persist = persist
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.is_leader = False
+        self._stop_event = threading.Event()
+        self._lock_file = None
+
+    # -- リーダー選出 ---------------------------------------------------------
+    def _acquire_leadership(self) -> bool:
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            self.is_leader = True
+            return True
+        lock_file = open(self.journal.path + ".lock", "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self.is_leader = True
+        logger.info("purchase journal: this process is now the flusher (pid %s)", os.getpid())
+        return True
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop_event.set()
+        self.join(timeout)
+
+    def run(self) -> None:
+        backoff = JOURNAL_FLUSH_INTERVAL
+        last_prune = 0.0
+        while not self._stop_event.is_set():
+            try:
+                if not self._acquire_leadership():
+                    self._stop_event.wait(1.0)
+                    continue
+                flushed = self.flush_once()
+                if time.monotonic() - last_prune > 600:
+                    self.journal.prune()
+                    last_prune = time.monotonic()
+            except Exception as exc:
+                # MySQL に届かない間だけでなく、ジャーナル側の sqlite3 エラー（ロック・ディスクフル）
+                # でもスレッドを落とさない。バックログとして溜め、指数バックオフで再試行
+                self.failures += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"[:500]
+                logger.exception("purchase journal: flush failed, retrying in %.1fs", backoff)
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2 or 0.1, JOURNAL_RETRY_BACKOFF_MAX)
+                continue
+            backoff = JOURNAL_FLUSH_INTERVAL
+            self.last_error = None
+            if flushed < JOURNAL_BATCH_SIZE:
+                self._stop_event.wait(JOURNAL_FLUSH_INTERVAL)
+        # 停止時は残りをできるだけ書き出す
+        if self.is_leader:
+            try:
+                while self.flush_once():
+                    pass
+            except Exception:
+                logger.exception("purchase journal: final flush failed; entries stay pending")
+
+    def flush_once(self) -> int:
+        """Group-commit up to ``JOURNAL_BATCH_SIZE`` pending entries; returns how many were handled."""
+        entries = self.journal.pending(JOURNAL_BATCH_SIZE)
+        if not entries:
+            return 0
+        with self.session_factory() as db:
+            remaining = self._skip_already_committed(db, entries)
+            if remaining:
+                try:
+                    self._commit(db, remaining)
+                except SQLAlchemyError as exc:
+                    db.rollback()
+                    if _is_transient(exc):
+                        raise
+                    # 接続以外のエラーはバッチを分割して原因の伝票だけを failed にする
+                    for entry in remaining:
+                        self._commit_single(db, entry)
+        self.batches += 1
+        return len(entries)
+
+    def _skip_already_committed(self, db: Session, entries: List[JournalEntry]) -> List[JournalEntry]:
+        """Crash recovery: entries whose key already reached MySQL are only marked flushed."""
+        existing = {
+            row.idem_key: row
+            for row in db.execute(
+                select(PurchaseIdempotency.idem_key, PurchaseIdempotency.request_hash, PurchaseIdempotency.trd_id)
+                .where(PurchaseIdempotency.idem_key.in_([e.idem_key for e in entries]))
+            )
+        }
+        db.rollback()
+        done, remaining = [], []
+        for entry in entries:
+            row = existing.get(entry.idem_key)
+            if row is None:
+                remaining.append(entry)
+            elif row.request_hash != entry.request_hash:
+                self.journal.mark_failed(entry.seq, "Idempotency-Key was already used with a different request")
+            else:
+                done.append((entry.seq, row.trd_id))
+        self.journal.mark_flushed(done)
+        return remaining
+
+    def _commit(self, db: Session, entries: List[JournalEntry]) -> None:
+        trd_ids = self.persist(db, entries)
+        now = datetime.utcnow()
+        db.execute(
+            insert(PurchaseIdempotency),
+            [
+                {
+                    "idem_key": entry.idem_key,
+                    "request_hash": entry.request_hash,
+                    "trd_id": trd_id,
+                    "response": json.dumps(entry.response(trd_id)),
+                    "created_at": now,
+                }
+                for entry, trd_id in zip(entries, trd_ids)
+            ],
+        )
+        db.commit()
+        self.journal.mark_flushed([(entry.seq, trd_id) for entry, trd_id in zip(entries, trd_ids)])
+        self.flushed += len(entries)
+
+    def _commit_single(self, db: Session, entry: JournalEntry) -> None:
+        try:
+            self._commit(db, [entry])
+        except SQLAlchemyError as exc:
+            db.rollback()
+            if _is_transient(exc):
+                raise
+            # 同じキーが他から先にコミットされていれば重複として flushed 扱い
+            if not self._skip_already_committed(db, [entry]):
+                return
+            self.journal.mark_failed(entry.seq, str(getattr(exc, "orig", exc)))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "alive": self.is_alive(),
+            "leader": self.is_leader,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "flush_failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+purchase_journal: Optional[PurchaseJournal] = None
+journal_flusher: Optional[JournalFlusher] = None
+
+
+def start(session_factory, persist: PersistFn) -> None:
+    global purchase_journal, journal_flusher
+    if purchase_journal is None:
+        purchase_journal = PurchaseJournal()
+    if journal_flusher is None or not journal_flusher.is_alive():
+        journal_flusher = JournalFlusher(purchase_journal, session_factory, persist)
+        journal_flusher.start()
+
+
+def flusher_alive() -> bool:
+    """False once the flusher thread has died; accepted receipts would then never reach MySQL."""
+    return journal_flusher is not None and journal_flusher.is_alive()
+
+
+def stop() -> None:
+    if journal_flusher is not None:
+        journal_flusher.stop()
@@ -5,21 +5,52 @@ import os
 
 ENV_FILE = os.getenv("ENV_FILE", ".env.production")
 load_dotenv(find_dotenv(ENV_FILE), override=False)
-from datetime import datetime
-from typing import List, Optional
-from decimal import Decimal, ROUND_HALF_UP
+import base64
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Literal, Optional
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, PositiveInt, Field
-from sqlalchemy import func
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from .db import SessionLocal
-from .models import Product, Transaction, TransactionDetail
+from .catalog import AMBIGUOUS, MISS, CachedProduct, product_cache
+from .catalog_feed import changes_since, record_upserts, snapshot_cache
+from . import admission, analytics, archive, idempotency, journal, pricing, sales_events, sql_profiler, warmup
+from .db import (
+    DB_ASYNC,
+    AsyncSessionLocal,
+    SessionLocal,
+    async_engine,
+    async_pool_stats,
+    async_replica_engine,
+    async_replica_pool_stats,
+    engine,
+    pool_stats,
+    replica_engine,
+    replica_pool_stats,
+)
+from .metrics import MetricsMiddleware, gauge_lines, instrument_engine, registry as metrics_registry
+from .models import DailySales, Product, Transaction, TransactionDetail
+from .product_import import import_products
+from .product_search import PRODUCT_SEARCH_LIMIT, search_index
+from .replica import is_replica, read_router
+from .receipts import CACHE_CONTROL, CachedReceipt, etag_matches, receipt_cache
+from .rollup import record_purchases
 
 from app.init_data import main as init_main
 
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
 # ✅ FastAPI instance with enhanced configuration for Azure
 app = FastAPI(
     title="POS API MVP", 
@@ -34,10 +65,178 @@ app = FastAPI(
 def health_check():
     return {"status": "healthy", "service": "pos-backend"}
 
+# Readiness: このワーカーのプールとカタログのウォームアップが済むまで 503
+@app.get("/ready")
+def readiness_check():
+    snapshot = warmup.state.snapshot()
+    if journal.JOURNAL_ENABLED:
+        # フラッシャが止まったワーカーは受付だけしてコミットしないので外してもらう
+        snapshot["journal_flusher_alive"] = journal.flusher_alive()
+    if not snapshot["ready"] or snapshot.get("journal_flusher_alive") is False:
+        return JSONResponse(status_code=503, content=snapshot, headers={"Retry-After": "1"})
+    return snapshot
+
+@app.on_event("startup")
+def start_warmup():
+    warmup.start(engine, SessionLocal)
+    read_router.start()
+    # SSE スナップショット用の当日累計を定期的に読み直す（他ワーカーの売上も含める）
+    sales_events.sales_bus.totals.start(SessionLocal)
+
+# コネクションプールの状態（チェックアウト数・オーバーフロー・待ち時間など）
+@app.get("/health/pool")
+def pool_health():
+    return {stats.name: stats.snapshot() for stats in _all_pool_stats()}
+
+def _all_pool_stats():
+    candidates = [pool_stats, async_pool_stats, replica_pool_stats, async_replica_pool_stats]
+    return [stats for stats in candidates if stats is not None]
+
+# レプリカの状態（遅延・振り分け件数）
+@app.get("/health/replica")
+def replica_health():
+    return read_router.stats()
+
+# キャッシュ統計（ヒット率からサイズを決める）
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "products": product_cache.stats(),
+        "receipts": receipt_cache.stats(),
+        "idempotency": idempotency.idempotency_store.stats(),
+        "product_search": search_index.stats(),
+        "analytics": analytics.sales_columns.stats(),
+    }
+
+# 売上ライブ配信の購読者数・配信件数・取りこぼし件数
+@app.get("/health/events")
+def events_health():
+    return sales_events.sales_bus.stats()
+
+# サンプリングした SQL プロファイル（N+1・遅いクエリ）
+if sql_profiler.PROFILING_ENABLED:
+    @app.get("/debug/profiles")
+    def list_sql_profiles(flagged: bool = False):
+        return {
+            **sql_profiler.profile_store.stats(),
+            "profiles": sql_profiler.profile_store.summaries(flagged_only=flagged),
+        }
+
+    @app.get("/debug/profiles/{profile_id}")
+    def read_sql_profile(profile_id: int):
+        report = sql_profiler.profile_store.get(profile_id)
+        if report is None:
+            raise HTTPException(status_code=404, detail="profile not found (expired or never sampled)")
+        return report
+
+    @app.delete("/debug/profiles", status_code=status.HTTP_204_NO_CONTENT)
+    def clear_sql_profiles():
+        sql_profiler.profile_store.clear()
+
+# 受付制御の枠ごとの実行中・待ち行列・拒否件数
+@app.get("/health/admission")
+def admission_health():
+    return {"enabled": admission.ADMISSION_ENABLED, "classes": admission.stats()}
+
+# 購入ジャーナル（ライトビハインド）の滞留状況
+@app.get("/health/journal")
+def journal_health():
+    if journal.purchase_journal is None:
+        return {"mode": journal.PURCHASE_WRITE_MODE}
+    body = {
+        "mode": journal.PURCHASE_WRITE_MODE,
+        **journal.purchase_journal.backlog(),
+        **(journal.journal_flusher.stats() if journal.journal_flusher is not None else {}),
+        "alive": journal.flusher_alive(),
+    }
+    if not body["alive"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+# Prometheus テキスト形式のメトリクス
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    pools = _all_pool_stats()
+    body = metrics_registry.render()
+    for key, help_text in (
+        ("checkedout", "Connections currently checked out"),
+        ("overflow", "Connections opened beyond pool_size"),
+        ("connects", "New DBAPI connections opened"),
+        ("invalidations", "Connections invalidated"),
+    ):
+        samples = []
+        for stats in pools:
+            value = stats.snapshot().get(key)
+            if value is not None:
+                samples.append(({"pool": stats.name}, value))
+        body += gauge_lines(f"db_pool_{key}", help_text, samples)
+    body += gauge_lines(
+        "db_pool_wait_seconds_total", "Time spent waiting for a pooled connection",
+        [({"pool": p.name}, p.wait_total) for p in pools],
+    )
+    cache = product_cache.stats()
+    body += gauge_lines(
+        "catalog_cache_lookups", "Catalog cache lookups by outcome",
+        [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])],
+    )
+    receipts = receipt_cache.stats()
+    body += gauge_lines(
+        "receipt_cache_lookups", "Receipt cache lookups by outcome",
+        [
+            ({"result": "hit"}, receipts["hits"]),
+            ({"result": "miss"}, receipts["misses"]),
+            ({"result": "not_modified"}, receipts["not_modified"]),
+        ],
+    )
+    body += gauge_lines("receipt_cache_bytes", "Serialized receipts held in memory", [({}, receipts["bytes"])])
+    if sql_profiler.PROFILING_ENABLED:
+        profiles = sql_profiler.profile_store.stats()
+        body += gauge_lines(
+            "sql_profiled_requests", "Requests sampled by the SQL profiler",
+            [({"result": "sampled"}, profiles["sampled"]), ({"result": "flagged"}, profiles["flagged"])],
+        )
+    if admission.ADMISSION_ENABLED:
+        gates = admission.stats()
+        body += gauge_lines(
+            "admission_in_flight", "Requests running per admission class",
+            [({"class": name}, g["in_flight"]) for name, g in gates.items()],
+        )
+        body += gauge_lines(
+            "admission_queue_depth", "Requests waiting per admission class",
+            [({"class": name}, g["queued"]) for name, g in gates.items()],
+        )
+        body += gauge_lines(
+            "admission_rejected", "Requests shed with 503 by class and reason",
+            [({"class": name, "reason": reason}, n) for name, g in gates.items() for reason, n in g["rejected"].items()],
+        )
+    events = sales_events.sales_bus.stats()
+    body += gauge_lines("sales_event_subscribers", "Connected /events/sales clients", [({}, events["subscribers"])])
+    body += gauge_lines(
+        "sales_events", "Sales events by outcome",
+        [({"result": "published"}, events["published"]), ({"result": "dropped"}, events["dropped"])],
+    )
+    if journal.purchase_journal is not None:
+        backlog = journal.purchase_journal.backlog()
+        body += gauge_lines(
+            "purchase_journal_entries", "Journal entries by status",
+            [({"status": "pending"}, backlog["pending"]), ({"status": "failed"}, backlog["failed"])],
+        )
+        body += gauge_lines(
+            "purchase_journal_oldest_pending_seconds", "Age of the oldest unflushed receipt",
+            [({}, backlog["oldest_pending_seconds"])],
+        )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 # ✅ 初期化エンドポイント（あとで削除OK）
 @app.post("/init")
 def initialize_data():
     init_main()
+    product_cache.invalidate()
+    receipt_cache.clear()
+    # 初期データは pymysql で直接入るため、差分配信の履歴にまとめて載せる
+    with SessionLocal() as db:
+        record_upserts(db, db.scalars(select(Product.code)).all())
+        db.commit()
     return {"message": "初期データ登録完了"}
 
 # ★──── Enhanced CORS Configuration for Azure ────★
@@ -54,6 +253,11 @@ azure_origins = [
 # Combine all origins and remove duplicates
 all_origins = list(set(allowed_origins + azure_origins))
 
+# 受付制御（書き込み・照合・参照・ヘルスで別々の同時実行枠）。
+# 503 にも CORS ヘッダが付くよう、CORS より内側に置く
+if admission.ADMISSION_ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware)
+
 # Configure CORS middleware with enhanced security
 app.add_middleware(
     CORSMiddleware,
@@ -68,10 +272,27 @@ app.add_middleware(
         "Content-Type",
         "Authorization",
         "X-Requested-With",
+        "Idempotency-Key",
+        "If-None-Match",
     ],
-    expose_headers=["X-Total-Count"],  # For pagination
+    expose_headers=["X-Total-Count", "X-DB-Queries", "X-DB-Time-Ms", "Idempotent-Replayed", "ETag", "X-Catalog-Version", "X-SQL-Profile", "Retry-After"],  # For pagination / query counts / retries / caching
     max_age=3600,  # Cache preflight requests for 1 hour
 )
+
+# ★──── 計測（ルート別レイテンシ・リクエスト毎の SQL 数）────★
+instrument_engine(engine)
+for _engine in (async_engine, async_replica_engine):
+    if _engine is not None:
+        instrument_engine(_engine.sync_engine)
+if replica_engine is not None:
+    instrument_engine(replica_engine)
+app.add_middleware(MetricsMiddleware)
+# SQL プロファイラ（SQL_PROFILE_SAMPLE_RATE > 0 のときだけフックを付ける）
+if sql_profiler.PROFILING_ENABLED:
+    for _engine in (engine, replica_engine, async_engine, async_replica_engine):
+        if _engine is not None:
+            sql_profiler.instrument_engine(getattr(_engine, "sync_engine", _engine))
+    app.add_middleware(sql_profiler.SQLProfilerMiddleware)
 # ★──────────────────────★
 
 # ---------------------------------------------------------------------------
@@ -84,17 +305,65 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# 読み取り専用エンドポイント用。レプリカが健全ならレプリカ、そうでなければプライマリ
+def get_read_db():
+    db = read_router.session()
+    try:
+        yield db
+    except OperationalError as exc:
+        if is_replica(db):
+            read_router.mark_down(exc)
+        raise
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    async with read_router.async_session() as db:
+        try:
+            yield db
+        except OperationalError as exc:
+            if is_replica(db):
+                read_router.mark_down(exc)
+            raise
+
+def _read_with_fallback(db: Session, fn, *args):
+    """Run ``fn(db, ...)``; a 404 from a lagging replica is retried on the primary (read-your-writes)."""
+    try:
+        return fn(db, *args)
+    except HTTPException as exc:
+        if exc.status_code != 404 or not is_replica(db):
+            raise
+    read_router.record_fallback()
+    with SessionLocal() as primary:
+        return fn(primary, *args)
+
+async def _read_with_fallback_async(db, fn, *args):
+    try:
+        return await db.run_sync(fn, *args)
+    except HTTPException as exc:
+        if exc.status_code != 404 or not is_replica(db):
+            raise
+    read_router.record_fallback()
+    async with AsyncSessionLocal() as primary:
+        return await primary.run_sync(fn, *args)
+
+# 非同期モードのハンドラは AsyncSession.run_sync() で同期ヘルパーを共有する。
+# run_sync は greenlet 上で async ドライバを使うため、スレッドプールを占有しない。
+
 # ---------------------------------------------------------------------------
 # Pydantic スキーマ
 # ---------------------------------------------------------------------------
-TAX_RATE = Decimal("0.10")  # 10% 固定
-
 class ProductOut(BaseModel):
     prd_id: int = Field(..., alias="id")
     code: str
     name: str
     price_ex_tax: int
     price_in_tax: int
+    tax_div: str
     class Config:
         orm_mode = True
         allow_population_by_field_name = True
@@ -115,6 +384,23 @@ class PurchaseResponse(BaseModel):
     total_amount: int
     total_amount_ex: int
 
+class PurchaseAccepted(BaseModel):
+    success: bool
+    receipt_id: str
+    status: Literal["pending", "flushed", "failed"]
+    transaction_id: Optional[int] = None  # flushed になると採番される
+    total_amount: int
+    total_amount_ex: int
+    error: Optional[str] = None
+
+class PurchaseBatchResult(BaseModel):
+    index: int
+    success: bool
+    transaction_id: Optional[int] = None
+    total_amount: Optional[int] = None
+    total_amount_ex: Optional[int] = None
+    error: Optional[str] = None
+
 class TransactionLine(BaseModel):
     prd_name: str
     quantity: int
@@ -127,110 +413,934 @@ class TransactionOut(BaseModel):
     total_amount: int
     items: List[TransactionLine]
 
+class TransactionSummary(BaseModel):
+    transaction_id: int
+    datetime: datetime
+    emp_cd: str
+    store_cd: str
+    pos_no: str
+    total_amount_ex: int
+    total_amount: int
+
+class DailySalesRow(BaseModel):
+    business_date: date
+    store_cd: Optional[str] = None
+    pos_no: Optional[str] = None
+    prd_id: Optional[int] = None
+    quantity: int
+    amount_ex: int
+    line_count: int
+
+class TopProduct(BaseModel):
+    prd_id: int
+    name: Optional[str] = None
+    quantity: int
+    amount: int
+
+class HourlyRevenue(BaseModel):
+    hour: datetime  # 営業時間（BUSINESS_DAY_UTC_OFFSET_HOURS 適用後）の毎正時
+    revenue: int
+    quantity: int
+    receipts: int
+
+class ProductPair(BaseModel):
+    prd_ids: List[int]
+    names: List[Optional[str]]
+    receipts: int  # 両方を含む伝票数
+    support: float
+    lift: float
+
+class ProductImportResult(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    rejected: int
+    errors: List[str]
+
+class CatalogProduct(BaseModel):
+    id: int
+    code: str
+    name: str
+    price_ex_tax: int
+    price_in_tax: int
+    tax_div: str
+
+class CatalogDeletion(BaseModel):
+    id: int
+    code: str
+
+class CatalogChanges(BaseModel):
+    version: int
+    reset: bool  # True なら /products/snapshot から取り直す
+    has_more: bool
+    upserts: List[CatalogProduct]
+    deletes: List[CatalogDeletion]
+
+class ProductSearchResult(BaseModel):
+    items: List[ProductOut]
+    truncated: bool  # True なら時間予算内に探しきれなかった（上位のみ）
+
+class TransactionPage(BaseModel):
+    items: List[TransactionSummary]
+    next_cursor: Optional[str] = None
+
 # ---------------------------------------------------------------------------
 # 1) 商品マスタ検索
 # ---------------------------------------------------------------------------
-@app.get("/products/{code}", response_model=ProductOut)
-def read_product(code: str, db: Session = Depends(get_db)):
-    product = (
-        db.query(Product)
-        .filter((Product.code == code) | (func.right(Product.code, 6) == code))
-        .first()
-    )
-    if not product:
+def _lookup_product(db: Session, code: str):
+    """Resolve a full code or 6-digit suffix through the catalog cache.
+
+    Returns a ``CachedProduct``, ``AMBIGUOUS`` or ``None``.
+    """
+    product_cache.maybe_sync(db)
+    cached = product_cache.get(code)
+    if cached is not MISS:
+        return cached
+
+    # 6桁以下なら下6桁列、それ以外はフルコードの一意索引を1回だけ引く
+    if len(code) <= 6:
+        rows = db.query(Product).filter(Product.code_suffix == code).limit(2).all()
+    else:
+        rows = db.query(Product).filter(Product.code == code).limit(1).all()
+    if not rows:
+        result = None
+    elif len(rows) > 1:
+        result = AMBIGUOUS
+    else:
+        result = CachedProduct.from_row(rows[0])
+    # レプリカでの未検出は反映遅れの可能性があるのでキャッシュしない（プライマリで再確認）
+    if result is not None or not is_replica(db):
+        product_cache.put(code, result)
+    return result
+
+def _found_product(product) -> CachedProduct:
+    if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    return {
-        "id": product.prd_id,
-        "code": product.code,
-        "name": product.name,
-        "price_ex_tax": product.price,
-        "price_in_tax": int(Decimal(product.price) * (1 + TAX_RATE)),
+    if product is AMBIGUOUS:
+        raise HTTPException(status_code=409, detail="Ambiguous product code; scan the full code")
+    return product
+
+class PreEncodedJSONResponse(Response):
+    """Response whose content is already JSON bytes.
+
+    Returning it skips ``response_model`` validation and re-encoding; the
+    route keeps ``response_model`` for the OpenAPI schema only.
+    """
+    media_type = "application/json"
+
+# 端末ローカル照合用のカタログ配信。/products/{code} より先に登録すること
+CATALOG_CHANGES_LIMIT = int(os.getenv("CATALOG_CHANGES_LIMIT", "5000"))
+CATALOG_CACHE_CONTROL = "no-cache"  # 毎回 ETag で再検証させる
+
+@app.get("/products/snapshot")
+def catalog_snapshot(
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
+    """Full catalog (tax-inclusive prices computed) at the current version."""
+    version, bodies = snapshot_cache.get(db, pricing.price_in_tax)
+    use_gzip = "gzip" in (accept_encoding or "").lower()
+    headers = {
+        "ETag": f'"catalog-v{version}{"-gz" if use_gzip else ""}"',
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+        "X-Catalog-Version": str(version),
     }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=bodies[use_gzip], media_type="application/json", headers=headers)
+
+@app.get("/products/changes", response_model=CatalogChanges)
+def catalog_changes(
+    response: Response,
+    since: int = Query(..., ge=0, description="version the terminal already has"),
+    limit: int = Query(CATALOG_CHANGES_LIMIT, ge=1, le=CATALOG_CHANGES_LIMIT),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
+    """Products changed after ``since``; follow ``version`` while ``has_more``."""
+    result = changes_since(db, since, limit, pricing.price_in_tax)
+    if result["reset"] and is_replica(db):
+        # 端末の版がレプリカより新しい（プライマリから取得済み）ならプライマリで答える
+        read_router.record_fallback()
+        with SessionLocal() as primary:
+            result = changes_since(primary, since, limit, pricing.price_in_tax)
+    etag = f'"catalog-v{since}-v{result["version"]}"'
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if not result["reset"] and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return result
+
+@app.get("/products/search", response_model=ProductSearchResult)
+def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(PRODUCT_SEARCH_LIMIT, ge=1, le=100),
+):
+    """Name/code prefix and substring search from the in-memory index (no table scan)."""
+    # 変更履歴はプライマリで追う（レプリカとの往復で版が戻ると全件再構築になるため）
+    search_index.maybe_refresh(SessionLocal, pricing.price_in_tax)
+    products, truncated = search_index.search(q, limit)
+    # 各商品の JSON はキャッシュ済みのバイト列をつなぐだけ
+    return PreEncodedJSONResponse(
+        b'{"items":[' + b",".join(p.body for p in products) + b'],"truncated":'
+        + (b"true}" if truncated else b"false}")
+    )
+
+def _read_product(db: Session, code: str) -> CachedProduct:
+    return _found_product(_lookup_product(db, code))
+
+if DB_ASYNC:
+    @app.get("/products/{code}", response_model=ProductOut)
+    async def read_product(code: str, db: AsyncSession = Depends(get_async_read_db)):
+        product = await _read_with_fallback_async(db, _read_product, code)
+        return PreEncodedJSONResponse(product.body)
+else:
+    @app.get("/products/{code}", response_model=ProductOut)
+    def read_product(code: str, db: Session = Depends(get_read_db)):
+        return PreEncodedJSONResponse(_read_with_fallback(db, _read_product, code).body)
 
 # ---------------------------------------------------------------------------
 # 2) 購入登録
 # ---------------------------------------------------------------------------
-@app.post("/purchase", response_model=PurchaseResponse, status_code=status.HTTP_201_CREATED)
-def create_purchase(payload: PurchaseRequest, db: Session = Depends(get_db)):
+PURCHASE_BATCH_MAX = int(os.getenv("PURCHASE_BATCH_MAX", "1000"))
+PURCHASE_BATCH_CHUNK_SIZE = int(os.getenv("PURCHASE_BATCH_CHUNK_SIZE", "100"))
+
+def _resolve_products(db: Session, prd_ids: Iterable[int]) -> Dict[int, CachedProduct]:
+    """Load every referenced product with one ``IN (...)`` query (duplicates merged)."""
+    unique_ids = set(prd_ids)
+    if not unique_ids:
+        return {}
+    rows = db.query(Product).filter(Product.prd_id.in_(unique_ids)).all()
+    return {p.prd_id: CachedProduct.from_row(p) for p in rows}
+
+def _purchase_header(payload: PurchaseRequest, products: Dict[int, CachedProduct]) -> dict:
+    """Validate a receipt and compute its ``trd`` column values."""
     if not payload.items:
         raise HTTPException(status_code=400, detail="items list is empty")
 
-    emp_cd = payload.emp_cd or "9999999999"
-    store_cd = payload.store_cd or "30"
-    pos_no = payload.pos_no or "90"
-
-    total_ex = 0
+    # 税は税区分ごとの合計に対して 1 回だけ端数処理する
+    by_div: Dict[str, int] = {}
     for item in payload.items:
-        product: Product | None = db.query(Product).filter(Product.prd_id == item.prd_id).first()
+        product = products.get(item.prd_id)
         if not product:
             raise HTTPException(status_code=404, detail=f"Product id {item.prd_id} not found")
-        total_ex += product.price * item.quantity
+        by_div[product.tax_div] = by_div.get(product.tax_div, 0) + product.price * item.quantity
 
-    total_in = int(Decimal(total_ex * (1 + TAX_RATE)).quantize(0, ROUND_HALF_UP))
+    total_ex = sum(by_div.values())
+    total_in = pricing.total_in_tax(by_div)
 
-    transaction = Transaction(
-        datetime=datetime.utcnow(),
-        emp_cd=emp_cd,
-        store_cd=store_cd,
-        pos_no=pos_no,
-        total_amt=total_in,
-        total_amt_ex=total_ex,
-    )
+    return {
+        "datetime": datetime.utcnow(),
+        "emp_cd": payload.emp_cd or "9999999999",
+        "store_cd": payload.store_cd or "30",
+        "pos_no": payload.pos_no or "90",
+        "total_amt": total_in,
+        "total_amt_ex": total_ex,
+    }
+
+def _detail_rows(trd_id: int, items: List[PurchaseItemIn], products: Dict[int, CachedProduct]) -> List[dict]:
+    rows = []
+    for seq, item in enumerate(items, start=1):
+        product = products[item.prd_id]
+        rows.append({
+            "trd_id": trd_id,
+            "dtl_id": seq,
+            "prd_id": product.prd_id,
+            "prd_code": product.code,
+            "prd_name": product.name,
+            "prd_price": product.price,
+            "quantity": item.quantity,
+            "line_amount": product.price * item.quantity,
+            "tax_div": product.tax_div,
+        })
+    return rows
+
+def _insert_headers(db: Session, headers: List[dict]) -> List[int]:
+    """Insert ``trd`` rows and return their ids in input order."""
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.execute(
+            insert(Transaction).returning(Transaction.trd_id, sort_by_parameter_order=True),
+            headers,
+        )
+        return list(result.scalars())
+    # MySQL は RETURNING 非対応で、複数行 INSERT の採番が連番になる保証もないため
+    # ヘッダだけは 1 行ずつ INSERT する（コミットはまとめて 1 回）
+    return [db.execute(insert(Transaction), h).inserted_primary_key[0] for h in headers]
+
+def _persist_purchases(db: Session, prepared: List[tuple], products: Dict[int, CachedProduct]) -> List[int]:
+    """Write ``(payload, header)`` pairs without committing; returns the new ``trd_id``s."""
+    trd_ids = _insert_headers(db, [header for _, header in prepared])
+    written = [
+        (header, _detail_rows(trd_id, payload.items, products))
+        for trd_id, (payload, header) in zip(trd_ids, prepared)
+    ]
+    db.execute(insert(TransactionDetail), [d for _, details in written for d in details])
+    record_purchases(db, written)
+    for trd_id, (header, details) in zip(trd_ids, written):
+        sales_events.queue(db, trd_id, header, details)
+    return trd_ids
+
+def _create_purchase(db: Session, payload: PurchaseRequest, idem_key: Optional[str] = None):
+    """Register one receipt; returns ``(PurchaseResponse, replayed)``.
+
+    With ``idem_key`` the key row is claimed before ``trd`` is written, so a
+    retry (or a concurrent duplicate) gets the original response instead of a
+    second receipt.
+    """
+    idem_row = None
+    if idem_key is not None:
+        req_hash = idempotency.request_hash(jsonable_encoder(payload))
+        try:
+            idem_row, stored = idempotency.claim(db, idem_key, req_hash)
+        except idempotency.IdempotencyConflict:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key was already used with a different request"
+            )
+        if stored is not None:
+            return PurchaseResponse(**stored), True
+
+    products = _resolve_products(db, (item.prd_id for item in payload.items))
+    header = _purchase_header(payload, products)
+
+    transaction = Transaction(**header)
     db.add(transaction)
     db.flush()
+    trd_id = transaction.trd_id
 
-    seq = 1
-    for item in payload.items:
-        product = db.query(Product).filter(Product.prd_id == item.prd_id).first()
-        assert product is not None
-        detail = TransactionDetail(
-            trd_id=transaction.trd_id,
-            dtl_id=seq,
-            prd_id=product.prd_id,
-            prd_code=product.code,
-            prd_name=product.name,
-            prd_price=product.price,
-            quantity=item.quantity,
-            line_amount=product.price * item.quantity,
-        )
-        db.add(detail)
-        seq += 1
+    # 明細は複数行 INSERT 1 回で登録（ヘッダと同一トランザクション）
+    details = _detail_rows(trd_id, payload.items, products)
+    db.execute(insert(TransactionDetail), details)
+    record_purchases(db, [(header, details)])
+    # ダッシュボード向けの売上イベント（コミット後に配信される）
+    sales_events.queue(db, trd_id, header, details)
 
+    response = PurchaseResponse(
+        success=True,
+        transaction_id=trd_id,
+        total_amount=header["total_amt"],
+        total_amount_ex=header["total_amt_ex"],
+    )
+    if idem_row is not None:
+        idempotency.complete(idem_row, trd_id, jsonable_encoder(response))
     db.commit()
-    db.refresh(transaction)
+    if idem_row is not None:
+        idempotency.remember(idem_row, jsonable_encoder(response))
+    return response, False
 
-    return PurchaseResponse(
-        success=True,
-        transaction_id=transaction.trd_id,
-        total_amount=transaction.total_amt,
-        total_amount_ex=transaction.total_amt_ex,
+def _idempotency_key(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    value = value.strip()
+    if not value or len(value) > idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400, detail=f"Idempotency-Key must be 1-{idempotency.MAX_KEY_LENGTH} characters"
+        )
+    return value
+
+if journal.JOURNAL_ENABLED:
+    @app.post("/purchase", response_model=PurchaseAccepted, status_code=status.HTTP_202_ACCEPTED)
+    def create_purchase(
+        payload: PurchaseRequest,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+        db: Session = Depends(get_db),
+    ):
+        return _accept_purchase(db, payload, _idempotency_key(idempotency_key))
+elif DB_ASYNC:
+    @app.post("/purchase", response_model=PurchaseResponse, status_code=status.HTTP_201_CREATED)
+    async def create_purchase(
+        payload: PurchaseRequest,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+        db: AsyncSession = Depends(get_async_db),
+    ):
+        # 非同期モードでは同時重複の待ち合わせを DB の一意制約だけに任せる
+        result, replayed = await db.run_sync(_create_purchase, payload, _idempotency_key(idempotency_key))
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+else:
+    @app.post("/purchase", response_model=PurchaseResponse, status_code=status.HTTP_201_CREATED)
+    def create_purchase(
+        payload: PurchaseRequest,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+        db: Session = Depends(get_db),
+    ):
+        key = _idempotency_key(idempotency_key)
+        if key is None:
+            return _create_purchase(db, payload)[0]
+        # 同じワーカーに届いた重複は先行リクエストの完了を待ち、LRU から応答する
+        with idempotency.idempotency_store.inflight(key):
+            result, replayed = _create_purchase(db, payload, key)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+# ---------------------------------------------------------------------------
+# 2-a) 購入登録（ライトビハインド: PURCHASE_WRITE_MODE=journal）
+# ---------------------------------------------------------------------------
+def _accept_purchase(db: Session, payload: PurchaseRequest, idem_key: Optional[str]) -> PurchaseAccepted:
+    """Validate and price a receipt, then append it to the local journal (no MySQL write)."""
+    products = _resolve_products(db, (item.prd_id for item in payload.items))
+    header = _purchase_header(payload, products)
+    db.rollback()  # 読み取りのみ。接続をすぐプールへ返す
+
+    data = {
+        "header": journal.encode_header(header),
+        "items": [
+            {
+                "prd_id": item.prd_id,
+                "code": products[item.prd_id].code,
+                "name": products[item.prd_id].name,
+                "price": products[item.prd_id].price,
+                "tax_div": products[item.prd_id].tax_div,
+                "quantity": item.quantity,
+            }
+            for item in payload.items
+        ],
+    }
+    req_hash = idempotency.request_hash(jsonable_encoder(payload))
+    entry, duplicate = journal.purchase_journal.append(idem_key, req_hash, data)
+    if duplicate and entry.request_hash != req_hash:
+        raise HTTPException(
+            status_code=422, detail="Idempotency-Key was already used with a different request"
+        )
+    return _purchase_status(entry)
+
+def _purchase_status(entry: journal.JournalEntry) -> PurchaseAccepted:
+    return PurchaseAccepted(
+        success=entry.status != journal.FAILED,
+        receipt_id=entry.receipt_id,
+        status=entry.status,
+        transaction_id=entry.trd_id,
+        total_amount=entry.data["header"]["total_amt"],
+        total_amount_ex=entry.data["header"]["total_amt_ex"],
+        error=entry.error,
+    )
+
+def _persist_journal_entries(db: Session, entries: List[journal.JournalEntry]) -> List[int]:
+    """Flusher callback: write journal entries through the batch path (no commit)."""
+    trd_ids: List[int] = []
+    prepared: List[tuple] = []
+    products: Dict[int, CachedProduct] = {}
+    for entry in entries:
+        snapshot = {
+            i["prd_id"]: CachedProduct(
+                prd_id=i["prd_id"],
+                code=i["code"],
+                name=i["name"],
+                price=i["price"],
+                tax_div=i.get("tax_div", pricing.DEFAULT_TAX_DIV),  # 税区分導入前の受付分
+            )
+            for i in entry.data["items"]
+        }
+        # 受付後に価格が変わった商品は、受付時点の価格で別グループとして書き込む
+        if any(products.get(prd_id, p) != p for prd_id, p in snapshot.items()):
+            trd_ids += _persist_purchases(db, prepared, products)
+            prepared, products = [], {}
+        products.update(snapshot)
+        payload = PurchaseRequest(
+            items=[PurchaseItemIn(prd_id=i["prd_id"], quantity=i["quantity"]) for i in entry.data["items"]]
+        )
+        prepared.append((payload, journal.decode_header(entry.data["header"])))
+    if prepared:
+        trd_ids += _persist_purchases(db, prepared, products)
+    return trd_ids
+
+@app.on_event("startup")
+def start_purchase_journal():
+    # 起動時に未反映のエントリがあれば、フラッシャがそのまま再送する（クラッシュ復旧）
+    if journal.JOURNAL_ENABLED:
+        journal.start(SessionLocal, _persist_journal_entries)
+
+@app.on_event("shutdown")
+def stop_purchase_journal():
+    if journal.JOURNAL_ENABLED:
+        journal.stop()
+
+if journal.JOURNAL_ENABLED:
+    @app.get("/purchases/{receipt_id}", response_model=PurchaseAccepted)
+    def read_purchase_status(receipt_id: str):
+        entry = journal.purchase_journal.get(receipt_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="receipt not found")
+        return _purchase_status(entry)
+
+# ---------------------------------------------------------------------------
+# 2-b) 一括購入登録（オフライン復帰時のレーン同期）
+# ---------------------------------------------------------------------------
+@app.post("/purchases/batch", response_model=List[PurchaseBatchResult])
+def create_purchase_batch(payloads: List[PurchaseRequest], db: Session = Depends(get_db)):
+    if len(payloads) > PURCHASE_BATCH_MAX:
+        raise HTTPException(
+            status_code=413, detail=f"too many receipts (max {PURCHASE_BATCH_MAX})"
+        )
+
+    products = _resolve_products(
+        db, (item.prd_id for payload in payloads for item in payload.items)
     )
 
+    results: List[Optional[PurchaseBatchResult]] = [None] * len(payloads)
+    prepared = []
+    for index, payload in enumerate(payloads):
+        try:
+            prepared.append((index, payload, _purchase_header(payload, products)))
+        except HTTPException as exc:
+            results[index] = PurchaseBatchResult(index=index, success=False, error=exc.detail)
+
+    def commit_chunk(chunk):
+        trd_ids = _persist_purchases(db, [(payload, header) for _, payload, header in chunk], products)
+        db.commit()
+        for trd_id, (index, _, header) in zip(trd_ids, chunk):
+            results[index] = PurchaseBatchResult(
+                index=index,
+                success=True,
+                transaction_id=trd_id,
+                total_amount=header["total_amt"],
+                total_amount_ex=header["total_amt_ex"],
+            )
+
+    for start in range(0, len(prepared), PURCHASE_BATCH_CHUNK_SIZE):
+        chunk = prepared[start:start + PURCHASE_BATCH_CHUNK_SIZE]
+        try:
+            commit_chunk(chunk)
+        except SQLAlchemyError:
+            db.rollback()
+            # チャンクが失敗したら 1 件ずつやり直し、原因の伝票だけを失敗として返す
+            for entry in chunk:
+                try:
+                    commit_chunk([entry])
+                except SQLAlchemyError as exc:
+                    db.rollback()
+                    results[entry[0]] = PurchaseBatchResult(
+                        index=entry[0], success=False, error=str(getattr(exc, "orig", exc))
+                    )
+
+    return results
+
 # ---------------------------------------------------------------------------
 # 3) 取引参照
 # ---------------------------------------------------------------------------
-@app.get("/transactions/{trd_id}", response_model=TransactionOut)
-def read_transaction(trd_id: int, db: Session = Depends(get_db)):
-    trd = db.query(Transaction).filter(Transaction.trd_id == trd_id).first()
-    if not trd:
-        raise HTTPException(status_code=404, detail="transaction not found")
+def _receipt_rows(db: Session, trd_id: int, header, detail):
+    # ヘッダと明細を 1 回の JOIN で取得する（明細のない伝票も返せるよう外部結合）
+    return db.execute(
+        select(
+            header.trd_id,
+            header.total_amt_ex,
+            header.total_amt,
+            detail.prd_name,
+            detail.quantity,
+            detail.prd_price,
+            detail.line_amount,
+        )
+        .outerjoin(detail, detail.trd_id == header.trd_id)
+        .where(header.trd_id == trd_id)
+        .order_by(detail.dtl_id)
+    ).all()
 
-    dtls = db.query(TransactionDetail).filter(TransactionDetail.trd_id == trd_id).all()
+def _load_transaction(db: Session, trd_id: int) -> TransactionOut:
+    rows = _receipt_rows(db, trd_id, *archive.HOT)
+    if not rows:
+        # 締め済み月の伝票はアーカイブ表へ移動している
+        rows = _receipt_rows(db, trd_id, *archive.ARCHIVE)
+    if not rows:
+        raise HTTPException(status_code=404, detail="transaction not found")
 
     items = [
         TransactionLine(
-            prd_name=d.prd_name,
-            quantity=d.quantity,
-            price_in_tax=d.prd_price,
-            line_amount=d.line_amount,
+            prd_name=r.prd_name,
+            quantity=r.quantity,
+            price_in_tax=r.prd_price,
+            line_amount=r.line_amount,
         )
-        for d in dtls
+        for r in rows
+        if r.prd_name is not None
     ]
 
     return TransactionOut(
-        transaction_id=trd.trd_id,
-        total_amount_ex=trd.total_amt_ex,
-        total_amount=trd.total_amt,
+        transaction_id=rows[0].trd_id,
+        total_amount_ex=rows[0].total_amt_ex,
+        total_amount=rows[0].total_amt,
         items=items,
     )
+
+def _serialize_receipt(receipt: TransactionOut) -> CachedReceipt:
+    body = json.dumps(
+        jsonable_encoder(receipt), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+    return CachedReceipt.from_body(body)
+
+def _receipt_response(entry: CachedReceipt, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(if_none_match, entry.etag):
+        receipt_cache.record_not_modified()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+if DB_ASYNC:
+    @app.get("/transactions/{trd_id}", response_model=TransactionOut)
+    async def read_transaction(
+        trd_id: int,
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_async_read_db),
+    ):
+        entry = receipt_cache.get(trd_id)
+        if entry is None:
+            entry = _serialize_receipt(await _read_with_fallback_async(db, _load_transaction, trd_id))
+            receipt_cache.put(trd_id, entry)
+        return _receipt_response(entry, if_none_match)
+else:
+    @app.get("/transactions/{trd_id}", response_model=TransactionOut)
+    def read_transaction(
+        trd_id: int,
+        if_none_match: Optional[str] = Header(None),
+        db: Session = Depends(get_read_db),
+    ):
+        # 確定済みの伝票は変わらないので、シリアライズ済みの本文をそのまま返す
+        # （購入直後でレプリカに未反映なら 404 → プライマリで読み直す）
+        entry = receipt_cache.get(trd_id)
+        if entry is None:
+            entry = _serialize_receipt(_read_with_fallback(db, _load_transaction, trd_id))
+            receipt_cache.put(trd_id, entry)
+        return _receipt_response(entry, if_none_match)
+
+# ---------------------------------------------------------------------------
+# 4) 取引一覧（キーセットページング）
+# ---------------------------------------------------------------------------
+def _encode_cursor(dt: datetime, trd_id: int) -> str:
+    raw = f"{dt.isoformat()}|{trd_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        dt, trd_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(dt), int(trd_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+def _approximate_count(db: Session, stmt) -> Optional[int]:
+    """Row estimate from the MySQL optimizer (``EXPLAIN``); ``None`` elsewhere."""
+    if db.get_bind().dialect.name != "mysql":
+        return None
+    plan = db.execute(stmt.prefix_with("EXPLAIN")).mappings().first()
+    return int(plan["rows"]) if plan and plan.get("rows") is not None else None
+
+@app.get("/transactions", response_model=TransactionPage)
+def list_transactions(
+    response: Response,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = Query(None, description="exclusive"),
+    store_cd: Optional[str] = None,
+    pos_no: Optional[str] = None,
+    emp_cd: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    count: Literal["exact", "approx", "none"] = Query("none", description="X-Total-Count (exact runs COUNT(*))"),
+    db: Session = Depends(get_read_db),
+):
+    after = _decode_cursor(cursor) if cursor else None
+
+    def filters_for(header):
+        filters = []
+        if date_from is not None:
+            filters.append(header.datetime >= date_from)
+        if date_to is not None:
+            filters.append(header.datetime < date_to)
+        if store_cd:
+            filters.append(header.store_cd == store_cd)
+        if pos_no:
+            filters.append(header.pos_no == pos_no)
+        if emp_cd:
+            filters.append(header.emp_cd == emp_cd)
+        return filters
+
+    # 期間がアーカイブにかからなければホット表だけを引く
+    headers = [header for header, _ in archive.tables_for(db, date_from)]
+
+    # 新しい順。OFFSET を使わず (datetime, trd_id) の直前位置から索引を引く
+    rows = []
+    for header in headers:
+        stmt = select(header).where(*filters_for(header))
+        if after:
+            after_dt, after_id = after
+            # 行値比較 (datetime, trd_id) < (...) は MySQL で索引の範囲条件にならないため、
+            # datetime の上限を単独で付けて範囲スキャンにし、同時刻は trd_id で切る
+            stmt = stmt.where(
+                header.datetime <= after_dt,
+                or_(header.datetime < after_dt, and_(header.datetime == after_dt, header.trd_id < after_id)),
+            )
+        stmt = stmt.order_by(header.datetime.desc(), header.trd_id.desc()).limit(limit + 1)
+        rows.extend(db.scalars(stmt).all())
+    if len(headers) > 1:
+        rows.sort(key=lambda t: (t.datetime, t.trd_id), reverse=True)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].datetime, rows[-1].trd_id)
+
+    if count != "none":
+        total = 0
+        for header in headers:
+            filters = filters_for(header)
+            part = None
+            if count == "approx":
+                part = _approximate_count(db, select(header.trd_id).where(*filters))
+            if part is None:
+                part = db.scalar(select(func.count()).select_from(header).where(*filters))
+            total += part
+        response.headers["X-Total-Count"] = str(total)
+
+    return TransactionPage(
+        items=[
+            TransactionSummary(
+                transaction_id=t.trd_id,
+                datetime=t.datetime,
+                emp_cd=t.emp_cd,
+                store_cd=t.store_cd,
+                pos_no=t.pos_no,
+                total_amount_ex=t.total_amt_ex,
+                total_amount=t.total_amt,
+            )
+            for t in rows
+        ],
+        next_cursor=next_cursor,
+    )
+
+# ---------------------------------------------------------------------------
+# 5) 取引エクスポート（CSV / NDJSON ストリーミング）
+# ---------------------------------------------------------------------------
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+
+def _export_columns(header, detail):
+    return [
+        header.trd_id,
+        header.datetime,
+        header.emp_cd,
+        header.store_cd,
+        header.pos_no,
+        header.total_amt,
+        header.total_amt_ex,
+        detail.dtl_id,
+        detail.prd_id,
+        detail.prd_code,
+        detail.prd_name,
+        detail.prd_price,
+        detail.quantity,
+        detail.line_amount,
+        detail.tax_div,
+    ]
+
+EXPORT_FIELDS = [c.key for c in _export_columns(*archive.HOT)]
+
+def _export_rows(date_from: datetime, date_to: datetime, store_cd: Optional[str]):
+    """Yield lists of export rows straight off a server-side cursor."""
+    # レスポンス送信中もセッションを保持する必要があるため、依存性注入ではなくここで開く
+    with read_router.session() as db:
+        # 古い順に出すため、アーカイブ → ホットの順で流す
+        for header, detail in reversed(archive.tables_for(db, date_from)):
+            stmt = (
+                select(*_export_columns(header, detail))
+                .join(detail, detail.trd_id == header.trd_id)
+                .where(header.datetime >= date_from, header.datetime < date_to)
+                .order_by(header.trd_id, detail.dtl_id)
+                .execution_options(stream_results=True, yield_per=EXPORT_YIELD_PER)
+            )
+            if store_cd:
+                stmt = stmt.where(header.store_cd == store_cd)
+            for partition in db.execute(stmt).partitions():
+                yield partition
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _encode_csv(partitions):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    for rows in partitions:
+        for row in rows:
+            writer.writerow([_export_value(v) for v in row])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def _encode_ndjson(partitions):
+    for rows in partitions:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_FIELDS, map(_export_value, row))), ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip ヘッダ付き
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.get("/exports/transactions")
+def export_transactions(
+    date_from: datetime,
+    date_to: datetime = Query(..., description="exclusive"),
+    format: Literal["csv", "ndjson"] = "csv",
+    gzip: bool = False,
+    store_cd: Optional[str] = None,
+):
+    if date_to <= date_from:
+        raise HTTPException(status_code=400, detail="date_to must be after date_from")
+
+    partitions = _export_rows(date_from, date_to, store_cd)
+    if format == "csv":
+        body, media_type = _encode_csv(partitions), "text/csv; charset=utf-8"
+    else:
+        body, media_type = _encode_ndjson(partitions), "application/x-ndjson"
+
+    filename = f"transactions_{date_from:%Y%m%d}_{date_to:%Y%m%d}.{format}"
+    if gzip:
+        body, media_type, filename = _gzip_stream(body), "application/gzip", filename + ".gz"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# ---------------------------------------------------------------------------
+# 6) 日別売上レポート（sales_daily 集計テーブルから回答）
+# ---------------------------------------------------------------------------
+@app.get("/reports/daily-sales", response_model=List[DailySalesRow])
+def daily_sales_report(
+    date_from: date,
+    date_to: date = Query(..., description="inclusive"),
+    store_cd: Optional[str] = None,
+    pos_no: Optional[str] = None,
+    prd_id: Optional[int] = None,
+    group_by: Literal["cell", "store", "product"] = "cell",
+    db: Session = Depends(get_read_db),
+):
+    filters = [DailySales.business_date >= date_from, DailySales.business_date <= date_to]
+    if store_cd:
+        filters.append(DailySales.store_cd == store_cd)
+    if pos_no:
+        filters.append(DailySales.pos_no == pos_no)
+    if prd_id is not None:
+        filters.append(DailySales.prd_id == prd_id)
+
+    dims = {
+        "cell": [DailySales.business_date, DailySales.store_cd, DailySales.pos_no, DailySales.prd_id],
+        "store": [DailySales.business_date, DailySales.store_cd],
+        "product": [DailySales.business_date, DailySales.prd_id],
+    }[group_by]
+    stmt = (
+        select(
+            *dims,
+            func.sum(DailySales.quantity).label("quantity"),
+            func.sum(DailySales.amount_ex).label("amount_ex"),
+            func.sum(DailySales.line_count).label("line_count"),
+        )
+        .where(*filters)
+        .group_by(*dims)
+        .order_by(*dims)
+    )
+    return [DailySalesRow(**row) for row in db.execute(stmt).mappings()]
+
+# ---------------------------------------------------------------------------
+# 7) 商品マスタ一括取込（CSV: code,name,price）
+# ---------------------------------------------------------------------------
+@app.post("/products/import", response_model=ProductImportResult)
+def import_product_master(
+    file: UploadFile = File(...),
+    encoding: str = "utf-8-sig",
+    db: Session = Depends(get_db),
+):
+    # UploadFile は一時ファイルにスプールされるので、そのまま逐次読みする
+    stream = io.TextIOWrapper(file.file, encoding=encoding, newline="")
+    try:
+        report = import_products(db, stream)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        stream.detach()
+    return ProductImportResult(**vars(report))
+
+# ---------------------------------------------------------------------------
+# 8) 売上ライブ配信（Server-Sent Events）
+# ---------------------------------------------------------------------------
+def _sse(event: str, data, event_id: Optional[int] = None) -> bytes:
+    lines = f"event: {event}\n"
+    if event_id is not None:
+        lines += f"id: {event_id}\n"
+    lines += "data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n\n"
+    return lines.encode("utf-8")
+
+@app.get("/events/sales")
+async def sales_event_stream(request: Request, store_cd: Optional[str] = None):
+    """Push committed sales as SSE: a ``snapshot`` of today's totals, then one ``sale`` per receipt."""
+    bus = sales_events.sales_bus
+    subscriber = bus.subscribe(store_cd)
+
+    async def stream():
+        try:
+            # 購読開始時点の累計はメモリから返す（DB を引かない）
+            yield _sse("snapshot", bus.totals.snapshot(store_cd))
+            while not await request.is_disconnected():
+                events, dropped = await subscriber.next(sales_events.SALES_EVENT_KEEPALIVE)
+                if dropped:
+                    # 追いつけず古いイベントを捨てた。クライアントはスナップショットを取り直す
+                    yield _sse("dropped", {"count": dropped, **bus.totals.snapshot(store_cd)})
+                for ev in events:
+                    yield _sse("sale", ev, ev["transaction_id"])
+                if not events and not dropped:
+                    yield b": keepalive\n\n"
+        finally:
+            bus.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---------------------------------------------------------------------------
+# 9) 売上分析（直近の明細を NumPy の列配列に保持して集計）
+# ---------------------------------------------------------------------------
+AnalyticsHours = Query(1, gt=0, le=analytics.ANALYTICS_WINDOW_HOURS, description="look-back window")
+
+def _sales_columns() -> analytics.SalesColumns:
+    # 追記は高水位より後の取引だけ。プライマリで読む（レプリカとの往復で取りこぼさないため）
+    analytics.sales_columns.maybe_refresh(SessionLocal)
+    return analytics.sales_columns
+
+@app.get("/analytics/top-products", response_model=List[TopProduct])
+def analytics_top_products(
+    hours: float = AnalyticsHours,
+    store_cd: Optional[str] = None,
+    by: Literal["quantity", "amount"] = "quantity",
+    limit: int = Query(10, ge=1, le=100),
+):
+    return _sales_columns().top_products(hours, store_cd, limit, by)
+
+@app.get("/analytics/hourly-revenue", response_model=List[HourlyRevenue])
+def analytics_hourly_revenue(
+    hours: float = Query(24, gt=0, le=analytics.ANALYTICS_WINDOW_HOURS),
+    store_cd: Optional[str] = None,
+):
+    return _sales_columns().hourly_revenue(hours, store_cd)
+
+@app.get("/analytics/pairs", response_model=List[ProductPair])
+def analytics_pairs(
+    hours: float = Query(24, gt=0, le=analytics.ANALYTICS_WINDOW_HOURS),
+    store_cd: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    min_count: int = Query(2, ge=1),
+):
+    return _sales_columns().pairs(hours, store_cd, limit, min_count)
@@ -0,0 +1,202 @@
+# backend/app/metrics.py
+"""Request latency histograms and per-request SQL counters (Prometheus text format)."""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+# X-DB-Queries / X-DB-Time-Ms ヘッダを返すか（N+1 の回帰検知用）
+METRICS_DEBUG_HEADERS = os.getenv("METRICS_DEBUG_HEADERS", "false").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (not thread-safe; guarded by the registry lock)."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        sep = "," if labels else ""
+        out = [
+            f'{name}_bucket{{{labels}{sep}le="{_fmt(bound)}"}} {n}'
+            for bound, n in zip(self.buckets, self.counts)
+        ]
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        out.append(f"{name}_sum{{{labels}}} {_fmt(self.total)}")
+        out.append(f"{name}_count{{{labels}}} {self.count}")
+        return out
+
+
+class RequestContext:
+    """Per-request SQL tally, shared with threadpool workers through a ContextVar."""
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_current: ContextVar[Optional[RequestContext]] = ContextVar("request_metrics", default=None)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], Histogram] = {}
+        self.responses: Dict[Tuple[str, str, str], int] = {}
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, elapsed: float, ctx: RequestContext) -> None:
+        key = (method, route)
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(ctx.queries)
+            self.db_time.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(ctx.db_time)
+            rkey = (method, route, str(status))
+            self.responses[rkey] = self.responses.get(rkey, 0) + 1
+
+    def observe_statement(self, elapsed: float) -> None:
+        with self._lock:
+            self.sql_statements += 1
+            self.sql_seconds += elapsed
+
+    def render(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            out += _header("http_request_duration_seconds", "histogram", "Request latency by route")
+            for (method, route), h in sorted(self.latency.items()):
+                out += h.lines("http_request_duration_seconds", _labels(method=method, route=route))
+            out += _header("http_requests_total", "counter", "Responses by route and status")
+            for (method, route, status), n in sorted(self.responses.items()):
+                out.append(f"http_requests_total{{{_labels(method=method, route=route, status=status)}}} {n}")
+            out += _header("http_request_db_queries", "histogram", "SQL statements per request")
+            for (method, route), h in sorted(self.queries.items()):
+                out += h.lines("http_request_db_queries", _labels(method=method, route=route))
+            out += _header("http_request_db_seconds", "histogram", "Time spent in SQL per request")
+            for (method, route), h in sorted(self.db_time.items()):
+                out += h.lines("http_request_db_seconds", _labels(method=method, route=route))
+            out += _header("db_statements_total", "counter", "SQL statements executed")
+            out.append(f"db_statements_total {self.sql_statements}")
+            out += _header("db_statement_seconds_total", "counter", "Time spent executing SQL")
+            out.append(f"db_statement_seconds_total {_fmt(self.sql_seconds)}")
+        return "\n".join(out) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def gauge_lines(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> str:
+    """Render extra gauges (pool, caches) in the same exposition format."""
+    out = _header(name, "gauge", help_text)
+    for labels, value in samples:
+        label_str = _labels(**labels)
+        out.append(f"{name}{{{label_str}}} {_fmt(value)}" if label_str else f"{name} {_fmt(value)}")
+    return "\n".join(out) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# SQLAlchemy フック
+# ---------------------------------------------------------------------------
+def instrument_engine(engine) -> None:
+    """Count statements and DB time for the request active on this thread/task."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        registry.observe_statement(elapsed)
+        ctx = _current.get()
+        if ctx is not None:
+            ctx.queries += 1
+            ctx.db_time += elapsed
+
+
+# ---------------------------------------------------------------------------
+# ASGI ミドルウェア
+# ---------------------------------------------------------------------------
+class MetricsMiddleware:
+    """Record per-route latency and SQL usage; optionally echo them as headers."""
+
+    def __init__(self, app, debug_headers: bool = METRICS_DEBUG_HEADERS):
+        self.app = app
+        self.debug_headers = debug_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ctx = RequestContext()
+        token = _current.set(ctx)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.debug_headers:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-queries", str(ctx.queries).encode()))
+                    headers.append((b"x-db-time-ms", f"{ctx.db_time * 1000:.2f}".encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # 未マッチのパスはラベルに入れない（カーディナリティ対策）
+            route_path = getattr(route, "path", None) or "unmatched"
+            registry.observe_request(
+                scope["method"], route_path, status_code, time.perf_counter() - start, ctx
+            )
+
+
+# ---------------------------------------------------------------------------
+# 書式ヘルパー
+# ---------------------------------------------------------------------------
+def _header(name: str, kind: str, help_text: str) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(
+        f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for k, v in labels.items()
+    )
+
+
+def _fmt(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -1,21 +1,27 @@
 # backend/app/models.py
 from __future__ import annotations
 
-from datetime import datetime
-from typing import List
+from datetime import date, datetime
+from typing import List, Optional
 
 from sqlalchemy import (
+    CheckConstraint,
     Column,
     Integer,
     String,
+    Text,
     CHAR,
+    Computed,
+    Date,
     DateTime,
     ForeignKey,
+    Index,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from app.db import Base
+from app.pricing import TAX_RATES
 
 # ────────────────────────────────
 # 商品マスタ (PRD_MST)
@@ -25,18 +31,53 @@ class Product(Base):
 
     prd_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     code: Mapped[str] = mapped_column(CHAR(13), unique=True, nullable=False)
+    # 下6桁（短縮コード検索用）。RIGHT(code, 6) の全件走査を避けるため永続化して索引を張る
+    code_suffix: Mapped[str] = mapped_column(
+        CHAR(6), Computed("SUBSTR(code, -6)", persisted=True)
+    )
     name: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
     price: Mapped[int] = mapped_column(Integer, nullable=False, comment="税抜円")
+    # 税区分（10: 標準税率 / 08: 軽減税率）。税込単価は app.pricing で求める
+    tax_div: Mapped[str] = mapped_column(CHAR(2), nullable=False, default="10", server_default="10")
 
     # 関連
     details: Mapped[List["TransactionDetail"]] = relationship(
         back_populates="product"
     )
 
+    __table_args__ = (
+        Index("IDX_PRD_CODE_SUFFIX", "code_suffix"),
+        CheckConstraint(f"tax_div IN ({', '.join(map(repr, TAX_RATES))})", name="CHK_PRD_TAX_DIV"),
+    )
+
     def __repr__(self) -> str:  # pragma: no cover
         return f"<Product {self.code} {self.name} ¥{self.price}>"
 
 
+# ────────────────────────────────
+# 商品マスタ変更履歴 (PRD_CHANGE_LOG) ― 端末向け差分配信用
+# ────────────────────────────────
+class ProductChange(Base):
+    __tablename__ = "prd_change_log"
+
+    # catalog_state.version から採番（コミット順に単調増加）
+    version: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    prd_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    code: Mapped[str] = mapped_column(CHAR(13), nullable=False)
+    op: Mapped[str] = mapped_column(CHAR(1), nullable=False)  # U: 追加・更新 / D: 削除
+    changed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<ProductChange v{self.version} {self.op} P{self.prd_id}>"
+
+
+class CatalogState(Base):
+    __tablename__ = "catalog_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)  # 常に 1 行
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 # ────────────────────────────────
 # 取引ヘッダ (TRD)
 # ────────────────────────────────
@@ -57,6 +98,14 @@ class Transaction(Base):
         back_populates="transaction", cascade="all, delete-orphan"
     )
 
+    # 取引一覧のキーセットページング (datetime, trd_id) 用の複合索引
+    __table_args__ = (
+        Index("IDX_TRD_DATETIME", "datetime", "trd_id"),
+        Index("IDX_TRD_STORE_DATETIME", "store_cd", "datetime", "trd_id"),
+        Index("IDX_TRD_STORE_POS_DATETIME", "store_cd", "pos_no", "datetime", "trd_id"),
+        Index("IDX_TRD_EMP_DATETIME", "emp_cd", "datetime", "trd_id"),
+    )
+
     def __repr__(self) -> str:  # pragma: no cover
         return f"<Transaction {self.trd_id} ¥{self.total_amt}>"
 
@@ -88,3 +137,93 @@ class TransactionDetail(Base):
 
     def __repr__(self) -> str:  # pragma: no cover
         return f"<Dtl T{self.trd_id}-{self.dtl_id} {self.prd_code}x{self.quantity}>"
+
+
+# ────────────────────────────────
+# 取引アーカイブ (TRD_ARCHIVE / TRD_DTL_ARCHIVE) ― 締め済み月の取引を移す
+# MySQL のパーティションは外部キーと併用できないため、ホット/アーカイブの 2 表構成にする
+# ────────────────────────────────
+class TransactionArchive(Base):
+    __tablename__ = "trd_archive"
+
+    trd_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    datetime: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    emp_cd: Mapped[str] = mapped_column(CHAR(10), nullable=False)
+    store_cd: Mapped[str] = mapped_column(CHAR(5), nullable=False)
+    pos_no: Mapped[str] = mapped_column(CHAR(3), nullable=False)
+    total_amt: Mapped[int] = mapped_column(Integer, nullable=False)      # 税込
+    total_amt_ex: Mapped[int] = mapped_column(Integer, nullable=False)   # 税抜
+
+    __table_args__ = (
+        Index("IDX_TRD_ARC_DATETIME", "datetime", "trd_id"),
+        Index("IDX_TRD_ARC_STORE_DATETIME", "store_cd", "datetime", "trd_id"),
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<TransactionArchive {self.trd_id} ¥{self.total_amt}>"
+
+
+class TransactionDetailArchive(Base):
+    __tablename__ = "trd_dtl_archive"
+
+    trd_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    dtl_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    prd_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    prd_code: Mapped[str] = mapped_column(CHAR(13), nullable=False)
+    prd_name: Mapped[str] = mapped_column(String(50), nullable=False)
+    prd_price: Mapped[int] = mapped_column(Integer, nullable=False)  # 税抜円
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    line_amount: Mapped[int] = mapped_column(Integer, nullable=False)  # 税抜円
+    tax_div: Mapped[str] = mapped_column(CHAR(2), nullable=False, default="10")
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<DtlArchive T{self.trd_id}-{self.dtl_id} {self.prd_code}x{self.quantity}>"
+
+
+# ────────────────────────────────
+# 日別売上集計 (SALES_DAILY) ― 営業日 × 店舗 × レジ × 商品
+# ────────────────────────────────
+class DailySales(Base):
+    __tablename__ = "sales_daily"
+
+    business_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    store_cd: Mapped[str] = mapped_column(CHAR(5), primary_key=True)
+    pos_no: Mapped[str] = mapped_column(CHAR(3), primary_key=True)
+    prd_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    amount_ex: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # 税抜円
+    line_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # 商品別レポート（全店舗横断）用
+    __table_args__ = (Index("IDX_SALES_DAILY_PRD", "prd_id", "business_date"),)
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<DailySales {self.business_date} {self.store_cd}-{self.pos_no} P{self.prd_id} x{self.quantity}>"
+
+
+# ────────────────────────────────
+# 集計ジョブの処理済み位置 (ROLLUP_STATE)
+# ────────────────────────────────
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    last_trd_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# ────────────────────────────────
+# 購入リクエストの冪等キー (PURCHASE_IDEM)
+# ────────────────────────────────
+class PurchaseIdempotency(Base):
+    __tablename__ = "purchase_idem"
+
+    idem_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(CHAR(64), nullable=False)  # SHA-256（別内容での再利用検知）
+    trd_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # PurchaseResponse JSON
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False, index=True
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover
+        return f"<PurchaseIdempotency {self.idem_key} T{self.trd_id}>"
@@ -0,0 +1,108 @@
+# backend/app/pool_stats.py
+"""Connection pool gauges collected from SQLAlchemy pool events."""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+
+
+class PoolStats:
+    """Counters for one engine's pool (connects, checkouts, invalidations, waits)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def attach(self, engine) -> "PoolStats":
+        self._engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "soft_invalidate", self._on_soft_invalidate)
+        return self
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+
+    def snapshot(self) -> Dict[str, object]:
+        pool = self._engine.pool if self._engine is not None else None
+        gauges = {}
+        for key in ("size", "checkedin", "checkedout", "overflow"):
+            fn = getattr(pool, key, None)
+            if callable(fn):
+                gauges[key] = fn()
+        with self._lock:
+            return {
+                "pool": type(pool).__name__ if pool is not None else None,
+                **gauges,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+                "wait": {
+                    "count": self.wait_count,
+                    "total_ms": round(self.wait_total * 1000, 3),
+                    "avg_ms": round(self.wait_total * 1000 / self.wait_count, 3) if self.wait_count else 0.0,
+                    "max_ms": round(self.wait_max * 1000, 3),
+                },
+            }
+
+    # -- event handlers ----------------------------------------------------
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_soft_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.soft_invalidations += 1
+
+
+class _WaitTimerMixin:
+    # プールにはチェックアウト待ちの開始を知らせるイベントが無いため、
+    # _do_get() の所要時間を待ち時間として計測する
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
+
+
+def instrumented_pool_class(base, stats: PoolStats):
+    """Subclass ``base`` so checkout wait time lands in ``stats``.
+
+    The stats object lives on the class so it survives ``pool.recreate()``.
+    """
+    return type(f"Instrumented{base.__name__}", (_WaitTimerMixin, base), {"stats": stats})
@@ -0,0 +1,45 @@
+# backend/app/pricing.py
+"""Tax-inclusive prices by tax division, in integer arithmetic.
+
+``prd_mst.tax_div`` (and ``trd_dtl.tax_div``) holds the rate as two digits.
+The unit price is truncated, as before. A receipt total rounds half up once
+per tax division, so one ``Decimal`` per line becomes a few integer
+operations per receipt.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TAX_DIV = "10"
+# 税区分 -> 税率（%）。10: 標準税率 / 08: 軽減税率（飲食料品など）
+TAX_RATES: Dict[str, int] = {"10": 10, "08": 8}
+
+_warned = set()
+
+
+def tax_rate(tax_div: str) -> int:
+    """Rate in percent; an unknown division is logged and priced at the standard rate."""
+    rate = TAX_RATES.get(tax_div)
+    if rate is None:
+        # 取込以外の経路（手作業の SQL など）で入った値で照合・購入を 500 にしない
+        if tax_div not in _warned:
+            _warned.add(tax_div)
+            logger.warning("unknown tax_div %r; using the standard rate (%s)", tax_div, DEFAULT_TAX_DIV)
+        rate = TAX_RATES[DEFAULT_TAX_DIV]
+    return rate
+
+
+def price_in_tax(price: int, tax_div: str = DEFAULT_TAX_DIV) -> int:
+    """Unit price including tax (truncated)."""
+    return price * (100 + tax_rate(tax_div)) // 100
+
+
+def total_in_tax(amounts_by_div: Dict[str, int]) -> int:
+    """Receipt total from the tax-exclusive amount of each tax division.
+
+    The tax of each division is rounded half up once, on that division's total.
+    """
+    return sum(amount + (amount * tax_rate(div) + 50) // 100 for div, amount in amounts_by_div.items())
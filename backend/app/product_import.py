@@ -0,0 +1,197 @@
+# backend/app/product_import.py
+"""Streaming product master (prd_mst) import with chunked multi-row upserts.
+
+    python -m app.product_import products.csv [--encoding cp932]
+
+CSV columns: code,name,price[,tax_div] (header row required; extra columns ignored).
+Without a ``tax_div`` column, existing products keep their tax division.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from .catalog import product_cache
+from .catalog_feed import record_upserts
+from .models import Product
+from .pricing import DEFAULT_TAX_DIV, TAX_RATES
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+PRODUCT_IMPORT_CHUNK_SIZE = int(os.getenv("PRODUCT_IMPORT_CHUNK_SIZE", "1000"))
+MAX_REPORTED_ERRORS = 100
+
+REQUIRED_COLUMNS = ("code", "name", "price")
+
+
+@dataclass
+class ImportReport:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejected: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def reject(self, line_no: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_no}: {reason}")
+
+
+def _validate(row: Dict[str, Optional[str]]) -> Tuple[Optional[dict], Optional[str]]:
+    code = (row.get("code") or "").strip()
+    name = (row.get("name") or "").strip()
+    price = (row.get("price") or "").strip()
+    if not code.isdigit() or len(code) > 13:
+        return None, f"invalid code {code!r} (up to 13 digits)"
+    if not name or len(name) > 50:
+        return None, f"invalid name {name!r} (1-50 characters)"
+    try:
+        price_value = int(price)
+    except ValueError:
+        return None, f"invalid price {price!r}"
+    if price_value < 0:
+        return None, f"negative price {price_value}"
+    result = {"code": code, "name": name, "price": price_value}
+    if "tax_div" in row:
+        tax_div = (row["tax_div"] or "").strip() or DEFAULT_TAX_DIV
+        if tax_div not in TAX_RATES:
+            return None, f"invalid tax_div {tax_div!r} ({'/'.join(TAX_RATES)})"
+        result["tax_div"] = tax_div
+    return result, None
+
+
+def _upsert(db: Session, rows: List[dict]) -> None:
+    """Multi-row ``INSERT ... ON DUPLICATE KEY UPDATE`` (or the dialect equivalent) on ``code``."""
+    dialect = db.get_bind().dialect.name
+    # tax_div 列のない CSV では既存商品の税区分を変えない
+    columns = [c for c in ("name", "price", "tax_div") if c in rows[0]]
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+
+        stmt = dialect_insert(Product).values(rows)
+        stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in columns})
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        stmt = dialect_insert(Product).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["code"],
+            set_={c: stmt.excluded[c] for c in columns},
+        )
+    db.execute(stmt)
+
+
+def _import_chunk(db: Session, chunk: List[Tuple[int, dict]], report: ImportReport) -> None:
+    # 同じコードがチャンク内に複数あれば後勝ち
+    by_code: Dict[str, Tuple[int, dict]] = {}
+    for line_no, row in chunk:
+        by_code[row["code"]] = (line_no, row)
+
+    existing = db.execute(
+        select(Product.code, Product.name, Product.price, Product.tax_div).where(
+            or_(
+                Product.code.in_(by_code),
+                Product.name.in_([row["name"] for _, row in by_code.values()]),
+            )
+        )
+    ).all()
+    current = {code: (name, price, tax_div) for code, name, price, tax_div in existing}
+    # MySQL の照合順序は大文字小文字を区別しないので casefold して比較する
+    name_owner = {name.casefold(): code for code, name, *_ in existing}
+
+    rows: List[dict] = []
+    inserted = updated = 0
+    for code, (line_no, row) in by_code.items():
+        # name も一意制約。別コードの商品名と衝突すると ON DUPLICATE KEY が
+        # その商品を上書きしてしまうため、ここで弾く
+        owner = name_owner.get(row["name"].casefold())
+        if owner is not None and owner != code:
+            report.reject(line_no, f"name {row['name']!r} already used by code {owner}")
+            continue
+        name_owner[row["name"].casefold()] = code
+        if code not in current:
+            inserted += 1
+        elif current[code] == (row["name"], row["price"], row.get("tax_div", current[code][2])):
+            report.unchanged += 1
+            continue
+        else:
+            updated += 1
+        rows.append(row)
+
+    if rows:
+        _upsert(db, rows)
+        # Core の一括 UPSERT は ORM イベントを通らないので、差分配信用の履歴を明示的に残す
+        record_upserts(db, [row["code"] for row in rows])
+    db.commit()
+    report.inserted += inserted
+    report.updated += updated
+
+
+def _chunks(iterator: Iterator, size: int) -> Iterator[list]:
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_products(db: Session, stream: TextIO, chunk_size: int = PRODUCT_IMPORT_CHUNK_SIZE) -> ImportReport:
+    """Validate and upsert a CSV stream chunk by chunk; memory is bounded by ``chunk_size``."""
+    report = ImportReport()
+    reader = csv.DictReader(stream)
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"missing CSV columns: {', '.join(missing)}")
+
+    try:
+        # 行番号はヘッダを 1 行目として数える
+        for raw_chunk in _chunks(enumerate(reader, start=2), chunk_size):
+            valid: List[Tuple[int, dict]] = []
+            for line_no, raw in raw_chunk:
+                row, error = _validate(raw)
+                if error:
+                    report.reject(line_no, error)
+                else:
+                    valid.append((line_no, row))
+            if valid:
+                _import_chunk(db, valid, report)
+    finally:
+        # 途中で失敗しても、コミット済みのチャンクはキャッシュに反映させる
+        if report.inserted or report.updated:
+            product_cache.invalidate()
+    return report
+
+
+def main(argv=None) -> None:
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Import a product master CSV (code,name,price[,tax_div])")
+    parser.add_argument("path")
+    parser.add_argument("--encoding", default="utf-8-sig")
+    parser.add_argument("--chunk-size", type=int, default=PRODUCT_IMPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding=args.encoding, newline="") as stream, SessionLocal() as db:
+        report = import_products(db, stream, args.chunk_size)
+    print(
+        f"✓ 追加 {report.inserted} / 更新 {report.updated} / "
+        f"変更なし {report.unchanged} / 不正 {report.rejected}"
+    )
+    for error in report.errors:
+        print(f"  ✗ {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# backend/app/product_search.py
+"""In-memory product search by name/code prefix and substring.
+
+Prefixes are answered from a sorted key array with ``bisect``; substrings
+of three characters or more from a trigram posting index, verified against
+the normalized text. The index is loaded once from ``prd_mst`` and then
+kept current by replaying ``prd_change_log`` (see ``catalog_feed``), so a
+search never scans the product table.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+import unicodedata
+import heapq
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .catalog import CachedProduct
+from .catalog_feed import changes_since, current_version
+from .models import Product
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+PRODUCT_SEARCH_LIMIT = int(os.getenv("PRODUCT_SEARCH_LIMIT", "20"))  # 返す件数の上限
+PRODUCT_SEARCH_BUDGET_MS = float(os.getenv("PRODUCT_SEARCH_BUDGET_MS", "20"))  # 1 検索あたりの時間予算
+PRODUCT_SEARCH_REFRESH = float(os.getenv("PRODUCT_SEARCH_REFRESH", "2"))  # 秒（変更履歴を見に行く間隔）
+PRODUCT_SEARCH_CHANGES_BATCH = 5000
+
+N = 3  # n-gram の長さ
+
+# 前方一致の種類。この順に上位へ並べる（同じ種類の中はキーの昇順）
+CODE_PREFIX = 0
+NAME_PREFIX = 1
+WORD_PREFIX = 2  # 名称 2 語目以降の先頭
+PREFIX_KINDS = (CODE_PREFIX, NAME_PREFIX, WORD_PREFIX)
+
+_WORD_SPLIT = re.compile(r"[\s\-_/・()（）]+")
+
+
+def normalize(text: str) -> str:
+    """NFKC + casefold, so full-width and half-width input match."""
+    return unicodedata.normalize("NFKC", text).casefold().strip()
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + N] for i in range(len(text) - N + 1)}
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.searches = 0
+        self.truncated = 0
+        self.rebuilds = 0
+        self.last_refresh = 0.0
+        self._products: Dict[int, CachedProduct] = {}
+        self._texts: Dict[int, Tuple[str, str]] = {}  # prd_id -> (正規化コード, 正規化名称)
+        # 前方一致用: 種類ごとの (キー, prd_id) 昇順配列
+        self._prefix: Dict[int, List[Tuple[str, int]]] = {kind: [] for kind in PREFIX_KINDS}
+        self._grams: Dict[str, Set[int]] = {}
+        self._lock = threading.RLock()
+        self._refreshing = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.version is not None
+
+    # -- 構築・更新 -----------------------------------------------------------
+    def _keys(self, prd_id: int) -> List[Tuple[int, Tuple[str, int]]]:
+        code, name = self._texts[prd_id]
+        keys = {(CODE_PREFIX, (code, prd_id)), (NAME_PREFIX, (name, prd_id))}
+        for word in _WORD_SPLIT.split(name)[1:]:
+            if word:
+                keys.add((WORD_PREFIX, (word, prd_id)))
+        return list(keys)
+
+    def _add(self, product: CachedProduct) -> None:
+        self._products[product.prd_id] = product
+        self._texts[product.prd_id] = (normalize(product.code), normalize(product.name))
+        for kind, key in self._keys(product.prd_id):
+            insort(self._prefix[kind], key)
+        for gram in _ngrams(self._texts[product.prd_id][1]) | _ngrams(self._texts[product.prd_id][0]):
+            self._grams.setdefault(gram, set()).add(product.prd_id)
+
+    def _remove(self, prd_id: int) -> None:
+        if prd_id not in self._products:
+            return
+        for kind, key in self._keys(prd_id):
+            keys = self._prefix[kind]
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        code, name = self._texts[prd_id]
+        for gram in _ngrams(name) | _ngrams(code):
+            postings = self._grams.get(gram)
+            if postings is not None:
+                postings.discard(prd_id)
+                if not postings:
+                    del self._grams[gram]
+        del self._products[prd_id]
+        del self._texts[prd_id]
+
+    def build(self, db: Session) -> None:
+        """Load every product (version and rows from the same transaction)."""
+        version = current_version(db)
+        rows = db.execute(select(Product.prd_id, Product.code, Product.name, Product.price, Product.tax_div)).all()
+        fresh = ProductSearchIndex()
+        for row in rows:
+            product = CachedProduct.from_row(row)
+            fresh._products[row.prd_id] = product
+            fresh._texts[row.prd_id] = (normalize(row.code), normalize(row.name))
+        # 全件構築は 1 件ずつの insort ではなく、まとめてソートする
+        for prd_id in fresh._products:
+            for kind, key in fresh._keys(prd_id):
+                fresh._prefix[kind].append(key)
+        for keys in fresh._prefix.values():
+            keys.sort()
+        for prd_id, (code, name) in fresh._texts.items():
+            for gram in _ngrams(name) | _ngrams(code):
+                fresh._grams.setdefault(gram, set()).add(prd_id)
+        with self._lock:
+            self._products, self._texts = fresh._products, fresh._texts
+            self._prefix, self._grams = fresh._prefix, fresh._grams
+            self.version = version
+            self.rebuilds += 1
+        self.last_refresh = time.monotonic()
+
+    def refresh(self, db: Session, price_in_tax) -> None:
+        """Apply catalog changes logged after ``version`` (full rebuild when unknown)."""
+        if not self.ready:
+            self.build(db)
+            return
+        while True:
+            result = changes_since(db, self.version, PRODUCT_SEARCH_CHANGES_BATCH, price_in_tax)
+            if result["reset"]:
+                self.build(db)
+                return
+            with self._lock:
+                for d in result["deletes"]:
+                    self._remove(d["id"])
+                for p in result["upserts"]:
+                    self._remove(p["id"])
+                    self._add(
+                        CachedProduct(
+                            prd_id=p["id"], code=p["code"], name=p["name"], price=p["price_ex_tax"], tax_div=p["tax_div"]
+                        )
+                    )
+                self.version = result["version"]
+            if not result["has_more"]:
+                return
+
+    def maybe_refresh(self, session_factory, price_in_tax) -> None:
+        """Refresh at most every ``PRODUCT_SEARCH_REFRESH`` seconds; other callers use the current index."""
+        if self.ready and time.monotonic() - self.last_refresh < PRODUCT_SEARCH_REFRESH:
+            return
+        # 初回構築だけは完了を待つ。それ以降は更新中なら待たずに現行の索引で答える
+        if not self._refreshing.acquire(blocking=not self.ready):
+            return
+        try:
+            if self.ready and time.monotonic() - self.last_refresh < PRODUCT_SEARCH_REFRESH:
+                return
+            with session_factory() as db:
+                self.refresh(db, price_in_tax)
+            self.last_refresh = time.monotonic()
+        finally:
+            self._refreshing.release()
+
+    # -- 検索 -----------------------------------------------------------------
+    def search(self, query: str, limit: int = PRODUCT_SEARCH_LIMIT, budget_ms: float = PRODUCT_SEARCH_BUDGET_MS):
+        """Return ``(products, truncated)``; ``truncated`` when the time budget ran out."""
+        q = normalize(query)
+        if not q:
+            return [], False
+        deadline = time.perf_counter() + budget_ms / 1000
+        found: List[int] = []
+        seen: Set[int] = set()
+        truncated = False
+        with self._lock:
+            # 前方一致: 配列はキー順なので、先頭から limit 件集まった時点で打ち切れる
+            for kind in PREFIX_KINDS:
+                keys = self._prefix[kind]
+                i = bisect_left(keys, (q,))
+                while i < len(keys) and len(found) < limit:
+                    key, prd_id = keys[i]
+                    if not key.startswith(q):
+                        break
+                    if prd_id not in seen:
+                        seen.add(prd_id)
+                        found.append(prd_id)
+                    i += 1
+                    if i % 64 == 0 and time.perf_counter() > deadline:
+                        truncated = True
+                        break
+                if truncated or len(found) >= limit:
+                    break
+
+            # 部分一致: n-gram の転置リストを小さい順に積集合し、本文で確認する
+            if len(q) >= N and not truncated and len(found) < limit:
+                postings = sorted((self._grams.get(g, set()) for g in _ngrams(q)), key=len)
+                candidates = postings[0].intersection(*postings[1:]) - seen
+                matches = []
+                for n, prd_id in enumerate(candidates):
+                    code, name = self._texts[prd_id]
+                    if q in name or q in code:
+                        matches.append((name, prd_id))
+                    if n % 64 == 63 and time.perf_counter() > deadline:
+                        truncated = True
+                        break
+                found += [prd_id for _, prd_id in heapq.nsmallest(limit - len(found), matches)]
+
+            products = [self._products[prd_id] for prd_id in found]
+            self.searches += 1
+            if truncated:
+                self.truncated += 1
+        return products, truncated
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "version": self.version,
+                "products": len(self._products),
+                "prefix_keys": sum(len(keys) for keys in self._prefix.values()),
+                "ngrams": len(self._grams),
+                "searches": self.searches,
+                "truncated": self.truncated,
+                "rebuilds": self.rebuilds,
+            }
+
+
+search_index = ProductSearchIndex()
@@ -0,0 +1,107 @@
+# backend/app/receipts.py
+"""In-process cache of serialized receipts (``GET /transactions/{trd_id}``).
+
+A committed receipt never changes, so its JSON body and strong ETag are
+computed once and served from a byte-bounded LRU afterwards.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+RECEIPT_CACHE_MAX_BYTES = int(os.getenv("RECEIPT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# ブラウザ側のキャッシュ期間（伝票は不変なので長めでよい）
+RECEIPT_MAX_AGE = int(os.getenv("RECEIPT_MAX_AGE", "86400"))
+
+CACHE_CONTROL = f"private, max-age={RECEIPT_MAX_AGE}, immutable"
+
+
+@dataclass(frozen=True)
+class CachedReceipt:
+    body: bytes
+    etag: str
+
+    @classmethod
+    def from_body(cls, body: bytes) -> "CachedReceipt":
+        return cls(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` comparison (weak comparison, as RFC 9110 requires for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ReceiptCache:
+    """LRU of ``trd_id -> CachedReceipt`` bounded by total body size."""
+
+    def __init__(self, max_bytes: int = RECEIPT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, CachedReceipt]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, trd_id: int) -> Optional[CachedReceipt]:
+        with self._lock:
+            entry = self._entries.get(trd_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(trd_id)
+            self.hits += 1
+            return entry
+
+    def put(self, trd_id: int, entry: CachedReceipt) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(trd_id, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self._entries[trd_id] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+                self.evictions += 1
+
+    def record_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+receipt_cache = ReceiptCache()
@@ -0,0 +1,151 @@
+# backend/app/replica.py
+"""Read/write routing between the primary and an optional read replica.
+
+Read-only endpoints take their session from ``read_router``; it hands out
+replica sessions only while a background probe finds the replica reachable
+and no more than ``REPLICA_MAX_LAG`` seconds behind. Lag is measured by
+comparing the newest ``trd`` row on both sides (two PK lookups), which works
+on any backend, including two local SQLite files standing in for the pair.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import select
+
+from .db import (
+    AsyncReplicaSessionLocal,
+    AsyncSessionLocal,
+    ReplicaSessionLocal,
+    SessionLocal,
+    engine,
+    replica_engine,
+)
+from .models import Transaction
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))  # 秒
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))  # 秒
+
+
+def _newest_trd(conn):
+    return conn.execute(
+        select(Transaction.trd_id, Transaction.datetime).order_by(Transaction.trd_id.desc()).limit(1)
+    ).first()
+
+
+def is_replica(session) -> bool:
+    return bool(session.info.get("replica"))
+
+
+class ReplicaRouter:
+    def __init__(self, primary_engine, replica_engine, max_lag: float = REPLICA_MAX_LAG):
+        self.primary_engine = primary_engine
+        self.replica_engine = replica_engine
+        self.max_lag = max_lag
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.replica_engine is not None
+
+    # -- 振り分け -------------------------------------------------------------
+    def use_replica(self) -> bool:
+        use = self.enabled and self.healthy
+        with self._lock:
+            if use:
+                self.replica_reads += 1
+            else:
+                self.primary_reads += 1
+        return use
+
+    def session(self):
+        return ReplicaSessionLocal() if self.use_replica() else SessionLocal()
+
+    def async_session(self):
+        return AsyncReplicaSessionLocal() if self.use_replica() else AsyncSessionLocal()
+
+    def record_fallback(self) -> None:
+        with self._lock:
+            self.fallbacks += 1
+
+    def mark_down(self, exc: BaseException) -> None:
+        """A replica query failed mid-request: route to the primary until the next good probe."""
+        if self.healthy:
+            logger.warning("replica marked unhealthy: %s", exc)
+        self.healthy = False
+        self.last_error = str(exc)
+
+    # -- 監視 -----------------------------------------------------------------
+    def check(self) -> bool:
+        """Probe replica reachability and lag; updates ``healthy``."""
+        try:
+            with self.replica_engine.connect() as conn:
+                replica_newest = _newest_trd(conn)
+            with self.primary_engine.connect() as conn:
+                primary_newest = _newest_trd(conn)
+        except Exception as exc:  # 接続不可・テーブル未作成など
+            self.lag = None
+            self.last_error = str(exc)
+            self.healthy = False
+        else:
+            if primary_newest is None or (replica_newest is not None and replica_newest.trd_id >= primary_newest.trd_id):
+                self.lag = 0.0
+            elif replica_newest is None:
+                self.lag = float("inf")
+            else:
+                self.lag = max(0.0, (primary_newest.datetime - replica_newest.datetime).total_seconds())
+            self.last_error = None
+            self.healthy = self.lag <= self.max_lag
+        self.last_check = time.time()
+        return self.healthy
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            was_healthy = self.healthy
+            if self.check() != was_healthy:
+                logger.info("replica %s (lag=%s)", "in service" if self.healthy else "out of service", self.lag)
+            self._stop.wait(REPLICA_CHECK_INTERVAL)
+
+    def start(self) -> None:
+        if self.enabled:
+            threading.Thread(target=self._run, name="replica-probe", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            counters = {
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads,
+                "fallbacks": self.fallbacks,
+            }
+        return {
+            "enabled": self.enabled,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag if self.lag != float("inf") else None,
+            "max_lag_seconds": self.max_lag,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            **counters,
+        }
+
+
+read_router = ReplicaRouter(engine, replica_engine)
@@ -0,0 +1,240 @@
+# backend/app/rollup.py
+"""Daily sales rollup (sales_daily) maintenance: inline updates, catch-up and rebuild.
+
+    python -m app.rollup catchup   # 高水位 (rollup_state.last_trd_id) 以降を反映
+    python -m app.rollup rebuild   # 全件から再計算
+"""
+from __future__ import annotations
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .models import (
+    DailySales,
+    RollupState,
+    Transaction,
+    TransactionArchive,
+    TransactionDetail,
+    TransactionDetailArchive,
+)
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+# inline  : create_purchase と同じトランザクションで更新
+# catchup : 購入時は何もしない（python -m app.rollup catchup を定期実行）
+# off     : 更新しない
+ROLLUP_MODE = os.getenv("ROLLUP_MODE", "inline")
+# trd.datetime は UTC。営業日はこの時差を足した日付（既定 JST）
+BUSINESS_DAY_UTC_OFFSET_HOURS = float(os.getenv("BUSINESS_DAY_UTC_OFFSET_HOURS", "9"))
+# キャッチアップは確定済みとみなせる（この秒数より古い）取引だけを対象にする
+ROLLUP_CATCHUP_LAG = float(os.getenv("ROLLUP_CATCHUP_LAG", "60"))
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "5000"))
+
+STATE_NAME = "sales_daily"
+
+_Key = Tuple[date, str, str, int]
+
+
+def business_date(dt: datetime) -> date:
+    return (dt + timedelta(hours=BUSINESS_DAY_UTC_OFFSET_HOURS)).date()
+
+
+def aggregate(lines: Iterable[Tuple[datetime, str, str, int, int, int]]) -> Dict[_Key, List[int]]:
+    """Fold ``(datetime, store_cd, pos_no, prd_id, quantity, line_amount)`` into cell deltas."""
+    cells: Dict[_Key, List[int]] = {}
+    for dt, store_cd, pos_no, prd_id, quantity, line_amount in lines:
+        cell = cells.setdefault((business_date(dt), store_cd, pos_no, prd_id), [0, 0, 0])
+        cell[0] += quantity
+        cell[1] += line_amount
+        cell[2] += 1
+    return cells
+
+
+def apply_deltas(db: Session, cells: Dict[_Key, List[int]]) -> None:
+    """Add deltas to ``sales_daily`` with one multi-row upsert (no commit)."""
+    if not cells:
+        return
+    # キー順に並べてロック順序を揃える（並行更新時のデッドロック回避）
+    rows = [
+        {
+            "business_date": key[0],
+            "store_cd": key[1],
+            "pos_no": key[2],
+            "prd_id": key[3],
+            "quantity": cell[0],
+            "amount_ex": cell[1],
+            "line_count": cell[2],
+        }
+        for key, cell in sorted(cells.items())
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+
+        stmt = dialect_insert(DailySales).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            quantity=DailySales.quantity + stmt.inserted.quantity,
+            amount_ex=DailySales.amount_ex + stmt.inserted.amount_ex,
+            line_count=DailySales.line_count + stmt.inserted.line_count,
+        )
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        stmt = dialect_insert(DailySales).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["business_date", "store_cd", "pos_no", "prd_id"],
+            set_={
+                "quantity": DailySales.quantity + stmt.excluded.quantity,
+                "amount_ex": DailySales.amount_ex + stmt.excluded.amount_ex,
+                "line_count": DailySales.line_count + stmt.excluded.line_count,
+            },
+        )
+    db.execute(stmt)
+
+
+def record_purchases(db: Session, purchases: Iterable[Tuple[dict, List[dict]]]) -> None:
+    """Inline hook: fold freshly inserted ``(header, detail_rows)`` into the rollup."""
+    if ROLLUP_MODE != "inline":
+        return
+    apply_deltas(
+        db,
+        aggregate(
+            (header["datetime"], header["store_cd"], header["pos_no"], d["prd_id"], d["quantity"], d["line_amount"])
+            for header, details in purchases
+            for d in details
+        ),
+    )
+
+
+# ---------------------------------------------------------------------------
+# キャッチアップ / 再構築
+# ---------------------------------------------------------------------------
+def _line_columns(header, detail):
+    return (
+        header.datetime,
+        header.store_cd,
+        header.pos_no,
+        detail.prd_id,
+        detail.quantity,
+        detail.line_amount,
+    )
+
+
+def _state(db: Session) -> RollupState:
+    state = db.execute(
+        select(RollupState).where(RollupState.name == STATE_NAME).with_for_update()
+    ).scalar_one_or_none()
+    if state is None:
+        state = RollupState(name=STATE_NAME, last_trd_id=0)
+        db.add(state)
+        db.flush()
+    return state
+
+
+def settled_prefix(rows, cutoff: datetime) -> List[int]:
+    """Leading ``trd_id``s (rows ordered by id) stamped before ``cutoff``.
+
+    The high-water mark must not pass an unsettled receipt: ids and stamps
+    interleave (batch chunks, journal flush lag), so a higher id can be older.
+    """
+    prefix = []
+    for trd_id, stamped in rows:
+        if stamped >= cutoff:
+            break
+        prefix.append(trd_id)
+    return prefix
+
+
+def _fold_batches(
+    db: Session, state: RollupState, *conditions, commit_each: bool,
+    header=Transaction, detail=TransactionDetail, cutoff: datetime = None,
+) -> int:
+    """Fold receipts above the high-water mark batch by batch (keyset on ``trd_id``).
+
+    With ``cutoff``, stop at the first receipt stamped at or after it.
+    """
+    processed = 0
+    while True:
+        rows = db.execute(
+            select(header.trd_id, header.datetime)
+            .where(header.trd_id > state.last_trd_id, *conditions)
+            .order_by(header.trd_id)
+            .limit(ROLLUP_BATCH_SIZE)
+        ).all()
+        trd_ids = [r[0] for r in rows] if cutoff is None else settled_prefix(rows, cutoff)
+        if not trd_ids:
+            return processed
+        lines = db.execute(
+            select(*_line_columns(header, detail))
+            .join(detail, detail.trd_id == header.trd_id)
+            .where(header.trd_id.in_(trd_ids))
+        )
+        apply_deltas(db, aggregate(lines))
+        state.last_trd_id = trd_ids[-1]
+        processed += len(trd_ids)
+        if commit_each:
+            db.commit()
+            state = _state(db)
+        if len(trd_ids) < len(rows):
+            return processed  # 未確定の取引で止める（次回はここから）
+
+
+def catch_up(db: Session, now: datetime = None) -> int:
+    """Apply receipts above the high-water mark; returns how many were folded in.
+
+    The high-water mark advances only over the contiguous run of receipts
+    older than ``ROLLUP_CATCHUP_LAG``; it stops at the first newer one, so
+    a lower ``trd_id`` stamped later than a higher one is never skipped.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=ROLLUP_CATCHUP_LAG)
+    processed = _fold_batches(db, _state(db), commit_each=True, cutoff=cutoff)
+    db.commit()
+    return processed
+
+
+def rebuild(db: Session) -> int:
+    """Recompute ``sales_daily`` from the hot and archive tables in one transaction."""
+    state = _state(db)
+    high_water = db.scalar(select(func.max(Transaction.trd_id))) or 0
+    db.execute(delete(DailySales))
+    # アーカイブ済みの締め月も含める（高水位はホット表の分だけを残す）
+    state.last_trd_id = 0
+    processed = _fold_batches(
+        db, state, commit_each=False, header=TransactionArchive, detail=TransactionDetailArchive
+    )
+    state.last_trd_id = 0
+    # trd_id のバッチ単位で集計・加算するので、メモリはバッチ分だけで済む
+    processed += _fold_batches(db, state, Transaction.trd_id <= high_water, commit_each=False)
+    db.commit()
+    return processed
+
+
+def main(argv=None) -> None:
+    from .db import SessionLocal
+
+    command = (argv or sys.argv[1:] or ["catchup"])[0]
+    with SessionLocal() as db:
+        if command == "rebuild":
+            print(f"✓ sales_daily を再構築しました（取引 {rebuild(db)} 件）")
+        elif command == "catchup":
+            if ROLLUP_MODE == "inline":
+                # inline モードでは高水位を進めないため、二重計上になる
+                print("⚠️  ROLLUP_MODE=inline ではキャッチアップは不要です（rebuild を使用）")
+                sys.exit(1)
+            print(f"✓ sales_daily に {catch_up(db)} 件の取引を反映しました")
+        else:
+            print("usage: python -m app.rollup [catchup|rebuild]")
+            sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
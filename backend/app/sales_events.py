@@ -0,0 +1,265 @@
+# backend/app/sales_events.py
+"""In-process pub/sub of committed sales for the ``GET /events/sales`` SSE feed.
+
+Purchase paths call ``queue(db, ...)`` next to their inserts; the events are
+held on the session and published by an ``after_commit`` listener, so a
+rolled-back receipt never reaches a dashboard. Each subscriber owns a
+bounded deque: when a slow client falls behind, its oldest events are
+dropped instead of growing memory or blocking the publisher.
+
+The bus lives in the worker process, so with several gunicorn workers a
+subscriber's live events are the receipts committed by its own worker. The
+running totals behind the snapshot are re-read from ``trd`` every
+``SALES_EVENT_RESEED`` seconds by a background thread, so they include
+the other workers' sales too and subscribing never waits on a query.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from .models import Transaction, TransactionDetail
+from .rollup import BUSINESS_DAY_UTC_OFFSET_HOURS, business_date
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+SALES_EVENT_QUEUE_SIZE = int(os.getenv("SALES_EVENT_QUEUE_SIZE", "256"))  # 購読者ごとの上限件数
+SALES_EVENT_KEEPALIVE = float(os.getenv("SALES_EVENT_KEEPALIVE", "15"))  # 秒
+# 当日累計を trd から読み直す間隔（秒）。0 で起動時の 1 回だけ
+SALES_EVENT_RESEED = float(os.getenv("SALES_EVENT_RESEED", "30"))
+
+_PENDING = "sales_events"
+
+
+def sale_event(trd_id: int, header: dict, details: List[dict]) -> dict:
+    return {
+        "transaction_id": trd_id,
+        "datetime": header["datetime"].isoformat(),
+        "store_cd": header["store_cd"],
+        "pos_no": header["pos_no"],
+        "total_amount": header["total_amt"],
+        "total_amount_ex": header["total_amt_ex"],
+        "items": sum(d["quantity"] for d in details),
+    }
+
+
+# ---------------------------------------------------------------------------
+# 営業日の累計（購読開始時のスナップショット）
+# ---------------------------------------------------------------------------
+class RunningTotals:
+    """Receipts and amounts per store for the current business date."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._date = None
+        self._stores: Dict[str, List[int]] = {}  # store_cd -> [receipts, amount, amount_ex, items]
+        self._during_seed: Optional[List[dict]] = None  # 読み直し中に発行されたイベント
+        self._stop = threading.Event()
+
+    def _roll(self, day) -> bool:
+        """Start a new day when ``day`` is newer; False for an older day."""
+        if self._date is None or day > self._date:
+            self._date, self._stores = day, {}
+        return day == self._date
+
+    def add(self, ev: dict) -> None:
+        with self._lock:
+            if self._during_seed is not None:
+                self._during_seed.append(ev)
+            self._add(ev)
+
+    def _add(self, ev: dict) -> None:
+        if not self._roll(business_date(datetime.fromisoformat(ev["datetime"]))):
+            return  # 前営業日の遅延分は当日の累計に含めない
+        cell = self._stores.setdefault(ev["store_cd"], [0, 0, 0, 0])
+        cell[0] += 1
+        cell[1] += ev["total_amount"]
+        cell[2] += ev["total_amount_ex"]
+        cell[3] += ev["items"]
+
+    def seed(self, db: Session, now: Optional[datetime] = None) -> None:
+        """Replace the totals with today's figures from ``trd`` (all workers' sales)."""
+        now = now or datetime.utcnow()
+        today = business_date(now)
+        start = datetime.combine(today, datetime.min.time()) - timedelta(hours=BUSINESS_DAY_UTC_OFFSET_HOURS)
+        with self._lock:
+            self._during_seed = []
+        try:
+            rows = db.execute(
+                select(
+                    Transaction.store_cd,
+                    func.count(),
+                    func.coalesce(func.sum(Transaction.total_amt), 0),
+                    func.coalesce(func.sum(Transaction.total_amt_ex), 0),
+                    func.max(Transaction.trd_id),
+                )
+                .where(Transaction.datetime >= start)
+                .group_by(Transaction.store_cd)
+            ).all()
+            items = dict(
+                db.execute(
+                    select(Transaction.store_cd, func.sum(TransactionDetail.quantity))
+                    .join(TransactionDetail, TransactionDetail.trd_id == Transaction.trd_id)
+                    .where(Transaction.datetime >= start)
+                    .group_by(Transaction.store_cd)
+                ).all()
+            )
+        except Exception:
+            with self._lock:
+                self._during_seed = None
+            raise
+        seen = max((int(r[4]) for r in rows), default=0)
+        with self._lock:
+            during, self._during_seed = self._during_seed, None
+            self._date = today
+            self._stores = {
+                store_cd: [int(n), int(amt), int(amt_ex), int(items.get(store_cd) or 0)]
+                for store_cd, n, amt, amt_ex, _ in rows
+            }
+            # 集計の読み取り後にコミットされた分（この worker の発行分）を足し直す
+            for ev in during:
+                if ev["transaction_id"] > seen:
+                    self._add(ev)
+
+    def _reseed_loop(self, session_factory) -> None:
+        while not self._stop.wait(SALES_EVENT_RESEED):
+            try:
+                with session_factory() as db:
+                    self.seed(db)
+            except Exception:  # DB 停止中は前回の値のまま。次の周期で再試行
+                logger.warning("sales totals reseed failed", exc_info=True)
+
+    def start(self, session_factory) -> None:
+        """Re-read the totals every ``SALES_EVENT_RESEED`` seconds in a daemon thread."""
+        if SALES_EVENT_RESEED > 0:
+            threading.Thread(
+                target=self._reseed_loop, args=(session_factory,), name="sales-totals", daemon=True
+            ).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def snapshot(self, store_cd: Optional[str] = None) -> dict:
+        with self._lock:
+            self._roll(business_date(datetime.utcnow()))
+            stores = {
+                code: {"receipts": c[0], "total_amount": c[1], "total_amount_ex": c[2], "items": c[3]}
+                for code, c in self._stores.items()
+                if store_cd is None or code == store_cd
+            }
+        return {"business_date": self._date.isoformat(), "stores": stores}
+
+
+# ---------------------------------------------------------------------------
+# バス
+# ---------------------------------------------------------------------------
+class Subscriber:
+    """One SSE client: bounded queue with drop-oldest backpressure."""
+
+    def __init__(self, store_cd: Optional[str], maxlen: int):
+        self.store_cd = store_cd
+        self.dropped = 0
+        self._reported = 0
+        self._queue: deque = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+
+    def push(self, ev: dict) -> None:
+        if self.store_cd is not None and ev["store_cd"] != self.store_cd:
+            return
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(ev)
+        # 発行元はスレッドプールやフラッシャのスレッドなので、ループ経由で起こす
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def next(self, timeout: float) -> Tuple[List[dict], int]:
+        """Wait up to ``timeout`` seconds; returns ``(events, dropped since last call)``."""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+        with self._lock:
+            events, self._queue = list(self._queue), deque(maxlen=self._queue.maxlen)
+            dropped, self._reported = self.dropped - self._reported, self.dropped
+        return events, dropped
+
+
+class SalesBus:
+    def __init__(self, queue_size: int = SALES_EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.totals = RunningTotals()
+        self.published = 0
+        self.dropped = 0
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, store_cd: Optional[str] = None) -> Subscriber:
+        """Register a subscriber (call from the event loop)."""
+        sub = Subscriber(store_cd, self.queue_size)
+        with self._lock:
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+            self.dropped += sub.dropped
+
+    def publish(self, events: List[dict]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += len(events)
+        for ev in events:
+            self.totals.add(ev)
+            for sub in subscribers:
+                try:
+                    sub.push(ev)
+                except RuntimeError:  # 購読者のループが閉じている（切断直後）
+                    pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped": self.dropped + sum(s.dropped for s in self._subscribers),
+            }
+
+
+sales_bus = SalesBus()
+
+
+# ---------------------------------------------------------------------------
+# コミット後に発行
+# ---------------------------------------------------------------------------
+def queue(db: Session, trd_id: int, header: dict, details: List[dict]) -> None:
+    """Hold a sale on the session; it is published only if the transaction commits."""
+    db.info.setdefault(_PENDING, []).append(sale_event(trd_id, header, details))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    events = session.info.pop(_PENDING, None)
+    if events:
+        sales_bus.publish(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING, None)
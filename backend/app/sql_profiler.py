@@ -0,0 +1,285 @@
+# backend/app/sql_profiler.py
+"""Sampled per-request SQL profiler: fingerprints, N+1 detection and slow-statement EXPLAIN.
+
+A sampled request records every statement with its timing and a normalized
+fingerprint (literals and ``IN``/``VALUES`` lists collapsed). The same
+fingerprint executed ``SQL_PROFILE_N_PLUS_ONE`` times or more in one request
+is flagged as a likely N+1; statements slower than ``SQL_PROFILE_SLOW_MS``
+are kept with their ``EXPLAIN`` plan. Reports go to ``/debug/profiles`` and,
+as one JSON line each, to the ``app.sql_profiler`` logger.
+
+With ``SQL_PROFILE_SAMPLE_RATE=0`` (default) neither the hooks nor the
+middleware are installed; an unsampled request costs one ContextVar lookup
+per statement.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+# プロファイルするリクエストの割合（0〜1）。開発は 1、本番は 0.01 程度
+SQL_PROFILE_SAMPLE_RATE = float(os.getenv("SQL_PROFILE_SAMPLE_RATE", "0"))
+SQL_PROFILE_SLOW_MS = float(os.getenv("SQL_PROFILE_SLOW_MS", "100"))
+SQL_PROFILE_EXPLAIN = os.getenv("SQL_PROFILE_EXPLAIN", "true").lower() in ("1", "true", "yes")
+# 同じフィンガープリントがこの回数以上なら N+1 とみなす
+SQL_PROFILE_N_PLUS_ONE = int(os.getenv("SQL_PROFILE_N_PLUS_ONE", "3"))
+SQL_PROFILE_KEEP = int(os.getenv("SQL_PROFILE_KEEP", "200"))  # 保持するレポート数
+# all: 全レポートをログ出力 / findings: N+1・遅いクエリがあるものだけ / off
+SQL_PROFILE_LOG = os.getenv("SQL_PROFILE_LOG", "findings")
+
+PROFILING_ENABLED = SQL_PROFILE_SAMPLE_RATE > 0
+MAX_STATEMENTS = 500  # 1 リクエストで保持する明細の上限（件数と時間は全件数える）
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize SQL so statements differing only in literals or list lengths compare equal."""
+    sql = _SPACE.sub(" ", statement).strip()
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM.sub("?", sql)
+    sql = _LIST.sub("(?)", sql)
+    sql = _ROWS.sub("(?)", sql)  # 複数行 VALUES
+    return sql
+
+
+class Profile:
+    """Statements of one sampled request."""
+
+    __slots__ = ("id", "method", "path", "route", "started", "statements", "counts", "db_time", "slow", "total")
+
+    def __init__(self, profile_id: int, method: str, path: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.started = time.time()
+        self.statements: List[dict] = []
+        self.counts: Counter = Counter()
+        self.db_time: Dict[str, float] = {}
+        self.slow: List[dict] = []
+        self.total = 0
+
+    def record(self, statement: str, elapsed: float, executemany: bool) -> str:
+        fp = fingerprint(statement)
+        self.total += 1
+        self.counts[fp] += 1
+        self.db_time[fp] = self.db_time.get(fp, 0.0) + elapsed
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append(
+                {"fingerprint": fp, "ms": round(elapsed * 1000, 3), "executemany": executemany}
+            )
+        return fp
+
+    def report(self, status: int, duration: float) -> dict:
+        n_plus_one = [
+            {"fingerprint": fp, "count": n, "total_ms": round(self.db_time[fp] * 1000, 3)}
+            for fp, n in self.counts.most_common()
+            if n >= SQL_PROFILE_N_PLUS_ONE
+        ]
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": status,
+            "started": self.started,
+            "duration_ms": round(duration * 1000, 3),
+            "statements": self.total,
+            "db_ms": round(sum(self.db_time.values()) * 1000, 3),
+            "n_plus_one": n_plus_one,
+            "slow": self.slow,
+            "detail": self.statements,
+        }
+
+
+_current: ContextVar[Optional[Profile]] = ContextVar("sql_profile", default=None)
+
+
+class ProfileStore:
+    """Ring buffer of recent reports."""
+
+    def __init__(self, keep: int = SQL_PROFILE_KEEP):
+        self._reports: deque = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.sampled = 0
+        self.flagged = 0
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, report: dict) -> None:
+        with self._lock:
+            self._reports.append(report)
+            self.sampled += 1
+            if report["n_plus_one"] or report["slow"]:
+                self.flagged += 1
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        with self._lock:
+            return next((r for r in self._reports if r["id"] == profile_id), None)
+
+    def summaries(self, flagged_only: bool = False) -> List[dict]:
+        with self._lock:
+            reports = list(self._reports)
+        return [
+            {k: r[k] for k in ("id", "method", "path", "route", "status", "duration_ms", "statements", "db_ms")}
+            | {"n_plus_one": len(r["n_plus_one"]), "slow": len(r["slow"])}
+            for r in reversed(reports)
+            if not flagged_only or r["n_plus_one"] or r["slow"]
+        ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reports.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "sample_rate": SQL_PROFILE_SAMPLE_RATE,
+                "sampled": self.sampled,
+                "flagged": self.flagged,
+                "kept": len(self._reports),
+            }
+
+
+profile_store = ProfileStore()
+
+
+# ---------------------------------------------------------------------------
+# EXPLAIN
+# ---------------------------------------------------------------------------
+_EXPLAIN_PREFIX = {"mysql": "EXPLAIN ", "postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}
+
+
+def _explain(conn, statement: str, parameters) -> object:
+    """Plan of ``statement`` via a raw DBAPI cursor (bypasses the engine events)."""
+    prefix = _EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None:
+        return None
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        columns = [d[0] for d in cursor.description or ()]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _explainable(statement: str, context, executemany: bool) -> bool:
+    if not SQL_PROFILE_EXPLAIN or executemany:
+        return False
+    # サーバサイドカーソルで結果を読み切っていない接続には別の文を流せない
+    if context is not None and context.execution_options.get("stream_results"):
+        return False
+    return statement.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE")
+
+
+# ---------------------------------------------------------------------------
+# SQLAlchemy フック
+# ---------------------------------------------------------------------------
+def instrument_engine(engine) -> None:
+    """Record statements for the sampled request active on this thread/task."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is None:
+            return
+        starts = conn.info.get("profile_query_start")
+        if not starts:
+            return  # サンプリング開始前に始まった文
+        elapsed = time.perf_counter() - starts.pop()
+        fp = profile.record(statement, elapsed, executemany)
+        if elapsed * 1000 >= SQL_PROFILE_SLOW_MS:
+            slow = {"fingerprint": fp, "sql": statement, "ms": round(elapsed * 1000, 3)}
+            if _explainable(statement, context, executemany):
+                try:
+                    slow["explain"] = _explain(conn, statement, parameters)
+                except Exception as exc:  # EXPLAIN の失敗で本処理を止めない
+                    slow["explain_error"] = str(exc)
+            profile.slow.append(slow)
+
+
+# ---------------------------------------------------------------------------
+# ASGI ミドルウェア
+# ---------------------------------------------------------------------------
+class SQLProfilerMiddleware:
+    """Sample requests, attach a ``Profile`` and publish its report when the response ends."""
+
+    def __init__(self, app, sample_rate: float = SQL_PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or random.random() >= self.sample_rate
+            or scope["path"].startswith("/debug/profiles")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(profile_store.next_id(), scope["method"], scope["path"])
+        token = _current.set(profile)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-profile", str(profile.id).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            profile.route = getattr(scope.get("route"), "path", None)
+            report = profile.report(status_code, time.perf_counter() - start)
+            profile_store.add(report)
+            _log(report)
+
+
+def _log(report: dict) -> None:
+    if SQL_PROFILE_LOG == "off":
+        return
+    flagged = bool(report["n_plus_one"] or report["slow"])
+    if SQL_PROFILE_LOG == "all" or flagged:
+        # 明細は重いのでログには載せない（/debug/profiles/{id} で参照）
+        entry = {k: v for k, v in report.items() if k != "detail"}
+        logger.log(
+            logging.WARNING if flagged else logging.INFO,
+            json.dumps({"event": "sql_profile", **entry}, ensure_ascii=False, default=str),
+        )
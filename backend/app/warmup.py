@@ -0,0 +1,124 @@
+# backend/app/warmup.py
+"""Per-worker warm-up: open pooled connections and preload the catalog cache.
+
+Runs in a background thread so a slow or unavailable database does not
+block the worker's boot; ``GET /ready`` reports 503 until it has finished.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import select, text
+
+from .catalog import CATALOG_CACHE_SIZE, CachedProduct, product_cache
+from .db import DB_POOL_SIZE
+from .models import Product
+from .product_search import search_index
+from .sales_events import sales_bus
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────
+# 環境変数
+# ────────────────────────────────
+WARMUP_POOL_CONNECTIONS = int(os.getenv("WARMUP_POOL_CONNECTIONS", str(DB_POOL_SIZE)))
+WARMUP_CATALOG_SIZE = int(os.getenv("WARMUP_CATALOG_SIZE", str(CATALOG_CACHE_SIZE)))
+WARMUP_RETRY_MAX = float(os.getenv("WARMUP_RETRY_MAX", "10"))  # 秒（再試行間隔の上限）
+
+
+class WarmupState:
+    def __init__(self):
+        self.ready = False
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.connections = 0
+        self.products = 0
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready,
+            "attempts": self.attempts,
+            "error": self.error,
+            "duration_seconds": round(self.duration, 3) if self.duration is not None else None,
+            "pool_connections": self.connections,
+            "catalog_products": self.products,
+        }
+
+
+state = WarmupState()
+
+
+def warm_pool(engine, count: int) -> int:
+    """Check out ``count`` connections at once so the pool really opens that many."""
+    conns = []
+    try:
+        for _ in range(count):
+            conn = engine.connect()
+            conns.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+def warm_catalog(session_factory, limit: int) -> int:
+    if limit <= 0:
+        return 0
+    with session_factory() as db:
+        rows = db.execute(
+            select(Product.prd_id, Product.code, Product.name, Product.price, Product.tax_div)
+            .order_by(Product.prd_id)
+            .limit(limit)
+        ).all()
+    for row in rows:
+        product_cache.put(row.code, CachedProduct.from_row(row))
+    return len(rows)
+
+
+def warm_sales_totals(session_factory) -> None:
+    # SSE 購読開始時のスナップショットを、再起動後も当日分から始める
+    with session_factory() as db:
+        sales_bus.totals.seed(db)
+
+
+def warm_search(session_factory) -> None:
+    with session_factory() as db:
+        search_index.build(db)
+
+
+def _run(engine, session_factory) -> None:
+    backoff = 0.5
+    started = time.monotonic()
+    while True:
+        state.attempts += 1
+        try:
+            state.connections = warm_pool(engine, WARMUP_POOL_CONNECTIONS)
+            state.products = warm_catalog(session_factory, WARMUP_CATALOG_SIZE)
+            warm_sales_totals(session_factory)
+            warm_search(session_factory)
+        except Exception as exc:  # DB 未起動など。準備完了にせず再試行する
+            state.error = str(exc)
+            logger.warning("warm-up failed (attempt %d): %s", state.attempts, exc)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, WARMUP_RETRY_MAX)
+            continue
+        state.error = None
+        state.duration = time.monotonic() - started
+        state.ready = True
+        logger.info(
+            "warm-up done in %.2fs (pid %s): %d connections, %d products",
+            state.duration, os.getpid(), state.connections, state.products,
+        )
+        return
+
+
+def start(engine, session_factory) -> threading.Thread:
+    thread = threading.Thread(target=_run, args=(engine, session_factory), name="warmup", daemon=True)
+    thread.start()
+    return thread
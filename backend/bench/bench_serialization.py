@@ -0,0 +1,220 @@
+# backend/bench/bench_serialization.py
+"""Micro-benchmark: CPU per scan lookup, Decimal + response_model path vs precomputed bytes.
+
+Runs in one process, without a network. The "before" path is the previous
+``read_product`` handler: ``Decimal`` tax calculation, a dict validated
+again through ``ProductOut``, then ``JSONResponse``. It is mounted next to
+the current ``/products/{code}`` route, so both go through the same
+middleware, dependencies and catalog cache. Requests are driven straight
+through the ASGI app. CPU time (``time.process_time``, all threads) is
+reported per request, along with the cost of the serialization step and
+the receipt total alone.
+
+    cd backend
+    pip install -r requirements.txt -r bench/requirements.txt
+    python bench/bench_serialization.py --requests 20000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Callable, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+from app import pricing  # noqa: E402
+from run_bench import BACKEND_DIR, BENCH_ENV_FILE, _git_commit, product_code, seed  # noqa: E402
+
+LEGACY_PATH = "/bench/legacy-products/{code}"
+TAX_RATE = Decimal("0.10")
+
+
+# ---------------------------------------------------------------------------
+# 変更前の処理（比較用に再現）
+# ---------------------------------------------------------------------------
+def legacy_product_dict(product) -> dict:
+    return {
+        "id": product.prd_id,
+        "code": product.code,
+        "name": product.name,
+        "price_ex_tax": product.price,
+        "price_in_tax": int(Decimal(product.price) * (1 + TAX_RATE)),
+        "tax_div": product.tax_div,
+    }
+
+
+def legacy_total(lines) -> int:
+    total_ex = 0
+    for price, quantity, _ in lines:
+        total_ex += price * quantity
+    return int(Decimal(total_ex * (1 + TAX_RATE)).quantize(0, ROUND_HALF_UP))
+
+
+def fast_total(lines) -> int:
+    # main._purchase_header と同じ集計
+    by_div: Dict[str, int] = {}
+    for price, quantity, tax_div in lines:
+        by_div[tax_div] = by_div.get(tax_div, 0) + price * quantity
+    return pricing.total_in_tax(by_div)
+
+
+def mount_legacy_route(main) -> None:
+    from fastapi import Depends
+    from sqlalchemy.orm import Session
+
+    def legacy_read(db: Session, code: str) -> dict:
+        return legacy_product_dict(main._found_product(main._lookup_product(db, code)))
+
+    def legacy_read_product(code: str, db: Session = Depends(main.get_read_db)):
+        return main._read_with_fallback(db, legacy_read, code)
+
+    main.app.add_api_route(LEGACY_PATH, legacy_read_product, methods=["GET"], response_model=main.ProductOut)
+
+
+# ---------------------------------------------------------------------------
+# 計測
+# ---------------------------------------------------------------------------
+def cpu_per_call(fn: Callable[[], object], n: int) -> float:
+    """Microseconds of process CPU per call."""
+    start = time.process_time()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - start) / n * 1e6
+
+
+async def _asgi_get(app, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def cpu_per_request(app, paths, n: int) -> float:
+    """Microseconds of process CPU per request through the full ASGI stack."""
+    start = time.process_time()
+    for i in range(n):
+        status = await _asgi_get(app, paths[i % len(paths)])
+        if status != 200:
+            raise RuntimeError(f"GET {paths[i % len(paths)]} returned {status}")
+    return (time.process_time() - start) / n * 1e6
+
+
+def _compare(before: float, after: float) -> Dict[str, float]:
+    return {"before_us": round(before, 2), "after_us": round(after, 2), "speedup": round(before / after, 2)}
+
+
+def run(args) -> dict:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    import app.main as main
+    from app.catalog import CachedProduct, product_cache
+
+    mount_legacy_route(main)
+    rng = random.Random(args.seed)
+    codes = [product_code(rng.randrange(args.catalog_size)) for _ in range(args.hot_skus)]
+    new_paths = [f"/products/{c}" for c in codes]
+    old_paths = [LEGACY_PATH.format(code=c) for c in codes]
+
+    loop = asyncio.new_event_loop()
+    try:
+        # キャッシュを温めてから、両方の経路を交互に計測する（DB 往復は含まない）
+        loop.run_until_complete(cpu_per_request(main.app, new_paths, len(new_paths)))
+        endpoint = {"before": [], "after": []}
+        for _ in range(args.rounds):
+            endpoint["before"].append(loop.run_until_complete(cpu_per_request(main.app, old_paths, args.requests)))
+            endpoint["after"].append(loop.run_until_complete(cpu_per_request(main.app, new_paths, args.requests)))
+    finally:
+        loop.close()
+
+    product = product_cache.get(codes[0])
+    sample = CachedProduct(prd_id=1, code=product.code, name=product.name, price=1980)
+
+    def legacy_serialize():
+        model = main.ProductOut.model_validate(legacy_product_dict(sample))
+        return JSONResponse(jsonable_encoder(model, by_alias=True)).body
+
+    def fast_serialize():
+        return main.PreEncodedJSONResponse(sample.body).body
+
+    lines = [(rng.randrange(100, 5000), rng.randrange(1, 4), "10") for _ in range(5)]
+    if legacy_serialize() != fast_serialize() or legacy_total(lines) != fast_total(lines):
+        raise RuntimeError("before/after outputs differ")
+    n = args.requests * 5
+
+    return {
+        "endpoint_get_product": _compare(min(endpoint["before"]), min(endpoint["after"])),
+        "serialize_product": _compare(cpu_per_call(legacy_serialize, n), cpu_per_call(fast_serialize, n)),
+        "receipt_total_5_lines": _compare(
+            cpu_per_call(lambda: legacy_total(lines), n), cpu_per_call(lambda: fast_total(lines), n)
+        ),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--catalog-size", type=int, default=5000)
+    parser.add_argument("--hot-skus", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000, help="requests per round and path")
+    parser.add_argument("--rounds", type=int, default=3, help="the fastest round of each path is reported")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="pos-bench-") as tmpdir:
+        database_url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        os.environ["ENV_FILE"] = BENCH_ENV_FILE
+        os.environ["ENV"] = "bench"
+        seed(database_url, args.catalog_size)
+        os.chdir(BACKEND_DIR)
+        results = run(args)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "catalog_size": args.catalog_size,
+            "requests_per_round": args.requests,
+            "rounds": args.rounds,
+        },
+        "cpu_per_call": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
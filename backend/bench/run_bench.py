@@ -0,0 +1,305 @@
+# backend/bench/run_bench.py
+"""Load-generation benchmark for the POS API.
+
+Seeds a throwaway database with a synthetic catalog, starts the FastAPI app
+under uvicorn and drives scan / purchase / receipt scenarios concurrently.
+Results (p50/p95/p99 latency, throughput, SQL statements per request) are
+printed as JSON so runs can be diffed between commits.
+
+    cd backend
+    pip install -r requirements.txt -r bench/requirements.txt
+    python bench/run_bench.py --catalog-size 20000 --requests 2000 --concurrency 32
+
+Use ``--database-url mysql+pymysql://...`` to seed a disposable MySQL schema
+instead of SQLite, or ``--url`` to benchmark an already running server
+(seeding is skipped; the catalog must have been created by this script).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 存在しない env ファイル名を指定して本番 .env を読み込ませない
+BENCH_ENV_FILE = ".env.bench"
+
+# 合成カタログのコード体系: "49" + 5桁の連番ブロック + 6桁の下6桁（一意）
+CODE_PREFIX = "49"
+
+
+def product_code(i: int) -> str:
+    return f"{CODE_PREFIX}{i // 1_000_000:05d}{i % 1_000_000:06d}"
+
+
+# ---------------------------------------------------------------------------
+# シード
+# ---------------------------------------------------------------------------
+def seed(database_url: str, catalog_size: int) -> None:
+    """Create the schema and insert ``catalog_size`` products (idempotent)."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("ENV_FILE", BENCH_ENV_FILE)
+    sys.path.insert(0, BACKEND_DIR)
+    from sqlalchemy import func, insert, select
+
+    from app.db import Base, SessionLocal, engine
+    from app.models import Product
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        existing = db.scalar(select(func.count()).select_from(Product)) or 0
+        for start in range(existing, catalog_size, 5000):
+            rows = [
+                {"code": product_code(i), "name": f"BENCH-{i:07d}", "price": 100 + (i % 50) * 20}
+                for i in range(start, min(start + 5000, catalog_size))
+            ]
+            db.execute(insert(Product), rows)
+            db.commit()
+    engine.dispose()
+
+
+# ---------------------------------------------------------------------------
+# サーバ起動
+# ---------------------------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str, workers: int, admission: bool = False) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "ENV_FILE": BENCH_ENV_FILE,
+        "ENV": "bench",
+        "METRICS_DEBUG_HEADERS": "true",
+        # 既定では受付制御を切る（同時実行 32 では枠を超えて 503 になり、以前の計測と比べられない）
+        "ADMISSION_ENABLED": "true" if admission else "false",
+        "PYTHONPATH": BACKEND_DIR,
+    }
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not become healthy within 30s")
+
+
+# ---------------------------------------------------------------------------
+# 負荷生成
+# ---------------------------------------------------------------------------
+class ScenarioResult:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.queries: List[int] = []
+        self.errors = 0
+        self.shed = 0  # 受付制御で断られた件数（エラー・スループットには含めない）
+        self.elapsed = 0.0
+
+    def summary(self) -> Dict[str, object]:
+        lat = sorted(self.latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not lat:
+                return None
+            # nearest-rank 法
+            return round(lat[max(0, math.ceil(p / 100 * len(lat)) - 1)] * 1000, 3)
+
+        return {
+            "requests": len(lat) + self.errors + self.shed,
+            "errors": self.errors,
+            "shed": self.shed,
+            "throughput_rps": round(len(lat) / self.elapsed, 1) if self.elapsed else 0.0,
+            "latency_ms": {
+                "p50": pct(50),
+                "p95": pct(95),
+                "p99": pct(99),
+                "mean": round(statistics.fmean(lat) * 1000, 3) if lat else None,
+                "max": round(lat[-1] * 1000, 3) if lat else None,
+            },
+            "queries_per_request": round(statistics.fmean(self.queries), 2) if self.queries else None,
+        }
+
+
+async def run_scenario(client, name, make_request, total, concurrency, ok_status=(200, 201)):
+    result = ScenarioResult(name)
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            method, path, body = make_request()
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, json=body)
+            except httpx.HTTPError:
+                result.errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+            if resp.status_code == 503 and "retry-after" in resp.headers:
+                result.shed += 1
+                continue
+            if resp.status_code not in ok_status:
+                result.errors += 1
+                continue
+            result.latencies.append(elapsed)
+            if "x-db-queries" in resp.headers:
+                result.queries.append(int(resp.headers["x-db-queries"]))
+            if name.startswith("purchase"):
+                purchase_ids.append(resp.json()["transaction_id"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+purchase_ids: List[int] = []
+
+
+async def drive(url: str, args) -> Dict[str, Dict[str, object]]:
+    rng = random.Random(args.seed)
+    # 「よく売れる数千 SKU」に偏ったアクセス（80% をホットセットから）
+    hot = [rng.randrange(args.catalog_size) for _ in range(min(args.hot_skus, args.catalog_size))]
+
+    def pick() -> int:
+        return rng.choice(hot) if rng.random() < 0.8 else rng.randrange(args.catalog_size)
+
+    def scan_full():
+        return "GET", f"/products/{product_code(pick())}", None
+
+    def scan_suffix():
+        return "GET", f"/products/{product_code(pick())[-6:]}", None
+
+    def purchase(lo, hi):
+        def make():
+            # prd_id は 1 始まりの連番（シード順）を前提とする
+            items = [{"prd_id": pick() + 1, "quantity": rng.randint(1, 3)} for _ in range(rng.randint(lo, hi))]
+            return "POST", "/purchase", {"items": items}
+        return make
+
+    def receipt():
+        return "GET", f"/transactions/{rng.choice(purchase_ids)}", None
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        scenarios = [
+            ("scan_full_code", scan_full),
+            ("scan_suffix", scan_suffix),
+            ("purchase_1_3_items", purchase(1, 3)),
+            ("purchase_20_30_items", purchase(20, 30)),
+            ("receipt_read", receipt),
+        ]
+        results = {}
+        for name, make in scenarios:
+            if name == "receipt_read" and not purchase_ids:
+                continue
+            # ウォームアップ（集計しない）
+            await run_scenario(client, name, make, min(args.concurrency * 2, args.requests), args.concurrency)
+            res = await run_scenario(client, name, make, args.requests, args.concurrency)
+            results[name] = res.summary()
+        return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--hot-skus", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--database-url", help="seed this database instead of a temporary SQLite file")
+    parser.add_argument("--url", help="benchmark an already running server (no seeding)")
+    parser.add_argument(
+        "--admission", action="store_true",
+        help="keep admission control on; rejected requests are reported as shed, not errors",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    proc = None
+    tmpdir = None
+    database_url = args.database_url
+    try:
+        if args.url:
+            url = args.url
+        else:
+            if not database_url:
+                tmpdir = tempfile.TemporaryDirectory(prefix="pos-bench-")
+                database_url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+            seed(database_url, args.catalog_size)
+            proc, url = start_server(database_url, args.workers, args.admission)
+
+        scenarios = asyncio.run(drive(url, args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "database": (database_url or "external").split(":", 1)[0],
+            "catalog_size": args.catalog_size,
+            "requests_per_scenario": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "admission": None if args.url else args.admission,
+        },
+        "scenarios": scenarios,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
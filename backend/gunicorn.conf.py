@@ -0,0 +1,31 @@
+# backend/gunicorn.conf.py - Production serving (gunicorn + uvicorn workers)
+#
+#   gunicorn -c gunicorn.conf.py app.main:app
+#
+# スキーマ確認・初期データ投入はマスタープロセスで fork 前に 1 回だけ行う。
+# 各ワーカーは起動後にプールとカタログを温め、完了すると GET /ready が 200 になる。
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# 既定はコア数。WEB_CONCURRENCY で上書き（DB 接続数 = workers × (DB_POOL_SIZE + DB_MAX_OVERFLOW) に注意）
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# DB 接続やスレッド（ジャーナルのフラッシャ等）を fork 前に作らないよう、アプリはワーカーごとに読み込む
+preload_app = False
+accesslog = "-" if os.getenv("GUNICORN_ACCESS_LOG", "false").lower() in ("1", "true", "yes") else None
+errorlog = "-"
+
+
+def on_starting(server):
+    if os.getenv("SKIP_SCHEMA_CHECK", "false").lower() in ("1", "true", "yes"):
+        return
+    from app.init_data import ensure_schema
+
+    try:
+        ensure_schema()
+    except Exception as e:  # 従来の `init_data || true` と同じく、失敗してもサーバは起動する
+        server.log.error(f"schema initialization failed: {e}")
@@ -0,0 +1,29 @@
+# backend/tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# app.db は import 時に接続先を決めるので、本番の .env.* を読ませず使い捨ての SQLite を向ける
+os.environ.setdefault("ENV_FILE", ".env.test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pos-test-'), 'app.db')}")
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Session on a fresh SQLite file with every model table."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app.db import Base
+    import app.models  # noqa: F401
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
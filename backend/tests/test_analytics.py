@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from app import analytics
+from app.models import Transaction, TransactionDetail
+
+NOW = datetime(2026, 10, 1, 3, 0)
+
+
+def _receipt(db, trd_id, stamped, quantity):
+    db.add(Transaction(
+        trd_id=trd_id, datetime=stamped, emp_cd="1", store_cd="30", pos_no="90",
+        total_amt=quantity * 110, total_amt_ex=quantity * 100,
+    ))
+    db.add(TransactionDetail(
+        trd_id=trd_id, dtl_id=1, prd_id=1, prd_code="4900000000001", prd_name="A",
+        prd_price=100, quantity=quantity, line_amount=quantity * 100,
+    ))
+
+
+def test_refresh_does_not_skip_lower_id_stamped_later(db):
+    settle = timedelta(seconds=analytics.ANALYTICS_SETTLE)
+    # 一括登録のチャンクの合間に入った購入: ID は小さいが時刻は新しい（まだ未確定）
+    _receipt(db, 1, NOW - settle / 2, quantity=1)
+    _receipt(db, 2, NOW - timedelta(hours=1), quantity=10)
+    _receipt(db, 3, NOW - timedelta(hours=2), quantity=100)
+    db.commit()
+    columns = analytics.SalesColumns(window_hours=24)
+
+    assert columns.refresh(db, now=NOW) == 0
+    assert columns.last_trd_id == 0  # 未確定の 1 を越えない
+
+    assert columns.refresh(db, now=NOW + settle) == 3
+    assert columns.last_trd_id == 3
+    assert sorted(columns._select(24, None, now=NOW + settle)["quantity"]) == [1, 10, 100]
+
+
+def test_first_load_skips_history_outside_the_window(db):
+    _receipt(db, 1, NOW - timedelta(hours=1), quantity=1)
+    _receipt(db, 2, NOW - timedelta(hours=30), quantity=10)  # 窓より古い
+    db.commit()
+    columns = analytics.SalesColumns(window_hours=24)
+
+    assert columns.refresh(db, now=NOW) == 1
+    assert columns.last_trd_id == 2
+
+
+def test_empty_window_starts_from_the_latest_id(db):
+    _receipt(db, 1, NOW - timedelta(hours=48), quantity=1)
+    _receipt(db, 2, NOW - timedelta(hours=30), quantity=10)
+    db.commit()
+    columns = analytics.SalesColumns(window_hours=24)
+
+    assert columns.refresh(db, now=NOW) == 0
+    assert columns.last_trd_id == 2
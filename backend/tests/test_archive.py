@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app import archive
+from app.models import Transaction, TransactionDetail
+
+NOW = datetime(2026, 10, 1, 3, 0)
+
+
+def _receipt(db, trd_id, stamped):
+    db.add(Transaction(
+        trd_id=trd_id, datetime=stamped, emp_cd="1", store_cd="30", pos_no="90", total_amt=110, total_amt_ex=100,
+    ))
+    db.add(TransactionDetail(
+        trd_id=trd_id, dtl_id=1, prd_id=1, prd_code="4900000000001", prd_name="A",
+        prd_price=100, quantity=1, line_amount=100,
+    ))
+
+
+def test_tables_for_sees_receipts_moved_by_another_process(db):
+    _receipt(db, 1, NOW - timedelta(days=1))
+    db.commit()
+    date_from = NOW - timedelta(days=2)
+    assert archive.tables_for(db, date_from) == [archive.HOT]
+
+    # アーカイブジョブは別プロセス（別セッション）で動き、API 側には何も知らせない
+    with Session(db.get_bind()) as job:
+        archive.archive_batch(job, [1])
+
+    assert archive.tables_for(db, date_from) == [archive.HOT, archive.ARCHIVE]
+    assert archive.tables_for(db, NOW) == [archive.HOT]
@@ -0,0 +1,93 @@
+# backend/tests/test_async_parity.py
+"""Sync/async parity: the same calls against SQLite give the same responses with DB_ASYNC off and on.
+
+``DB_ASYNC`` is read when ``app.db`` is imported, so each mode runs this
+file as a script in its own interpreter (fresh SQLite file, same seed) and
+the test compares what both wrote.
+
+    cd backend
+    pip install -r requirements-dev.txt
+    python -m pytest tests
+"""
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRODUCTS = [
+    ("4901681328401", "P-B3A12-BK", 2000),
+    ("4901681328402", "P-B3A12-BL", 150),
+    ("4901681999999", "P-B3A12-R", 98),
+]
+
+
+def scenario(client) -> list:
+    """Lookup, purchase and receipt calls; returns ``[name, status, body]`` triples."""
+    calls = [
+        ("lookup_full", lambda: client.get("/products/4901681328401")),
+        ("lookup_suffix", lambda: client.get("/products/999999")),
+        ("lookup_missing", lambda: client.get("/products/4900000000000")),
+        ("purchase", lambda: client.post(
+            "/purchase",
+            json={"store_cd": "30", "items": [{"prd_id": 1, "quantity": 2}, {"prd_id": 3, "quantity": 5}]},
+        )),
+        ("purchase_unknown_product", lambda: client.post("/purchase", json={"items": [{"prd_id": 99, "quantity": 1}]})),
+        ("purchase_empty", lambda: client.post("/purchase", json={"items": []})),
+        ("receipt", lambda: client.get("/transactions/1")),
+        ("receipt_missing", lambda: client.get("/transactions/999")),
+    ]
+    results = []
+    for name, call in calls:
+        response = call()
+        results.append([name, response.status_code, response.json()])
+    return results
+
+
+def _run_mode(tmp_path, db_async: bool) -> list:
+    mode = "async" if db_async else "sync"
+    out = tmp_path / f"{mode}.json"
+    env = {
+        **os.environ,
+        "ENV_FILE": ".env.test",  # 存在しない名前にして .env.* を読ませない
+        "DATABASE_URL": f"sqlite:///{tmp_path / f'{mode}.db'}",
+        "DB_ASYNC": "true" if db_async else "false",
+        "PURCHASE_WRITE_MODE": "direct",
+        "SQL_PROFILE_SAMPLE_RATE": "0",
+        "PARITY_OUTPUT": str(out),
+        "PYTHONPATH": BACKEND_DIR,
+    }
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)], cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert proc.returncode == 0, proc.stderr[-4000:]
+    return json.loads(out.read_text(encoding="utf-8"))
+
+
+def test_sync_and_async_responses_match(tmp_path):
+    sync_results = _run_mode(tmp_path, db_async=False)
+    async_results = _run_mode(tmp_path, db_async=True)
+
+    assert [status for _, status, _ in sync_results] == [200, 200, 404, 201, 404, 400, 200, 404]
+    assert async_results == sync_results
+
+
+if __name__ == "__main__":
+    from fastapi.testclient import TestClient
+
+    from app.db import DB_ASYNC, Base, SessionLocal, engine
+    from app.models import Product
+
+    assert DB_ASYNC == (os.environ["DB_ASYNC"] == "true")
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.add_all(Product(code=code, name=name, price=price) for code, name, price in PRODUCTS)
+        db.commit()
+
+    from app.main import app
+
+    with open(os.environ["PARITY_OUTPUT"], "w", encoding="utf-8") as fh:
+        json.dump(scenario(TestClient(app)), fh, ensure_ascii=False)
@@ -0,0 +1,80 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app import journal
+from app.models import Transaction
+
+HEADER = {
+    "datetime": datetime(2026, 10, 1, 3, 0), "emp_cd": "1", "store_cd": "30", "pos_no": "90",
+    "total_amt": 110, "total_amt_ex": 100,
+}
+
+
+class _Crash(Exception):
+    pass
+
+
+def _persist(db, entries):
+    # main._persist_journal_entries の代わりにヘッダだけを書く（コミットしない）
+    return [
+        db.execute(insert(Transaction).values(**journal.decode_header(e.data["header"]))).inserted_primary_key[0]
+        for e in entries
+    ]
+
+
+@pytest.fixture
+def purchase_journal(tmp_path):
+    return journal.PurchaseJournal(str(tmp_path / "journal.db"))
+
+
+def test_crash_after_mysql_commit_does_not_duplicate_receipts(db, purchase_journal, monkeypatch):
+    session_factory = sessionmaker(bind=db.get_bind())
+    entry, _ = purchase_journal.append("key-1", "hash-1", {"header": journal.encode_header(HEADER)})
+
+    # MySQL へのコミット直後、flushed にする前にプロセスが落ちた
+    def crash(done):
+        if done:
+            raise _Crash()
+
+    monkeypatch.setattr(purchase_journal, "mark_flushed", crash)
+    with pytest.raises(_Crash):
+        journal.JournalFlusher(purchase_journal, session_factory, _persist).flush_once()
+    monkeypatch.undo()
+    assert purchase_journal.get(entry.receipt_id).status == journal.PENDING
+
+    # 再起動後のフラッシャはキーを見つけて flushed にするだけ
+    restarted = journal.JournalFlusher(purchase_journal, session_factory, _persist)
+    assert restarted.flush_once() == 1
+    assert restarted.flushed == 0
+    recovered = purchase_journal.get(entry.receipt_id)
+    assert recovered.status == journal.FLUSHED
+    assert db.scalar(select(func.count()).select_from(Transaction)) == 1
+    assert recovered.trd_id == db.scalar(select(Transaction.trd_id))
+
+
+def test_flusher_survives_journal_errors(db, purchase_journal):
+    calls = []
+
+    def flaky_persist(session, entries):
+        calls.append(len(entries))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return _persist(session, entries)
+
+    purchase_journal.append(None, "hash-1", {"header": journal.encode_header(HEADER)})
+    flusher = journal.JournalFlusher(purchase_journal, sessionmaker(bind=db.get_bind()), flaky_persist)
+    flusher.start()
+    try:
+        deadline = time.monotonic() + 5
+        while flusher.flushed < 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert flusher.is_alive()
+        assert flusher.stats()["flush_failures"] == 1
+        assert flusher.flushed == 1
+    finally:
+        flusher.stop()
@@ -0,0 +1,46 @@
+# backend/tests/test_rollup.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app import rollup
+from app.models import DailySales, Product, RollupState, Transaction, TransactionDetail
+
+NOW = datetime(2026, 10, 1, 3, 0)
+
+
+def _receipt(db, trd_id, stamped, quantity):
+    db.add(Transaction(
+        trd_id=trd_id, datetime=stamped, emp_cd="1", store_cd="30", pos_no="90",
+        total_amt=quantity * 110, total_amt_ex=quantity * 100,
+    ))
+    db.add(TransactionDetail(
+        trd_id=trd_id, dtl_id=1, prd_id=1, prd_code="4900000000001", prd_name="A",
+        prd_price=100, quantity=quantity, line_amount=quantity * 100,
+    ))
+
+
+def _state(db):
+    return db.scalar(select(RollupState.last_trd_id).where(RollupState.name == rollup.STATE_NAME))
+
+
+def test_catch_up_does_not_skip_lower_id_stamped_later(db):
+    db.add(Product(prd_id=1, code="4900000000001", name="A", price=100))
+    lag = timedelta(seconds=rollup.ROLLUP_CATCHUP_LAG)
+    # 一括登録のチャンクの合間に入った購入: ID は小さいが時刻は新しい（まだ未確定）
+    _receipt(db, 1, NOW - lag / 2, quantity=1)
+    _receipt(db, 2, NOW - lag * 2, quantity=10)
+    _receipt(db, 3, NOW - lag * 3, quantity=100)
+    db.commit()
+
+    assert rollup.catch_up(db, now=NOW) == 0
+    assert _state(db) == 0  # 未確定の 1 を越えない
+
+    assert rollup.catch_up(db, now=NOW + lag) == 3
+    assert _state(db) == 3
+    assert db.scalar(select(func.sum(DailySales.quantity))) == 111
+
+
+def test_settled_prefix_stops_at_first_unsettled():
+    rows = [(1, NOW - timedelta(minutes=5)), (2, NOW), (3, NOW - timedelta(minutes=9))]
+    assert rollup.settled_prefix(rows, NOW) == [1]
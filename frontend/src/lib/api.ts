@@ -14,3 +14,11 @@ export const createPurchase = (payload: any) =>
 // 取引参照
 export const fetchTransaction = (id: number) =>
   api.get(`/transactions/${id}`).then((r) => r.data);
+
+// カタログ全件（端末ローカル照合用）。version を保存して差分取得に使う
+export const fetchCatalogSnapshot = () =>
+  api.get('/products/snapshot').then((r) => r.data);
+
+// since 以降の商品変更。reset=true なら全件を取り直す／has_more の間は version で続けて取得
+export const fetchCatalogChanges = (since: number) =>
+  api.get('/products/changes', { params: { since } }).then((r) => r.data);